@@ -3,10 +3,17 @@ from bedrock_agentcore.runtime import BedrockAgentCoreApp
 from strands import Agent, tool
 from strands.models import BedrockModel
 import boto3
+import contextvars
 import json
+import re
 import requests
+import pybreaker
 import os
+import threading
+import time
 from typing import List, Dict
+from guardrail_prefilter import BLOCKED_INPUT_MESSAGE, should_short_circuit
+from pii_prefilter import contains_blocked_pii
 
 app = BedrockAgentCoreApp()
 
@@ -14,6 +21,80 @@ app = BedrockAgentCoreApp()
 bedrock = boto3.client('bedrock-runtime', region_name='us-east-1')
 s3 = boto3.client('s3', region_name='us-east-1')
 
+# Shared HTTP session so FDIC/SEC calls reuse keep-alive connections
+http = requests.Session()
+
+# (connect, read) timeouts - fail fast on connect, allow slow FDIC/SEC responses
+UPSTREAM_TIMEOUT = (3, 10)
+
+# Circuit breakers per upstream: after 5 consecutive failures, short-circuit for 60s
+# instead of making every request wait out the timeout against a degraded service
+FDIC_BREAKER = pybreaker.CircuitBreaker(fail_max=5, reset_timeout=60, exclude=[requests.HTTPError], name="FDIC")
+SEC_BREAKER = pybreaker.CircuitBreaker(fail_max=5, reset_timeout=60, exclude=[requests.HTTPError], name="SEC EDGAR")
+BEDROCK_BREAKER = pybreaker.CircuitBreaker(fail_max=5, reset_timeout=60, name="Bedrock Knowledge Base")
+
+# Max concurrent outbound calls per invocation, so one request's parallel tool calls
+# can't monopolize the shared connection pool or burst FDIC/SEC into rate limits
+MAX_UPSTREAM_CALLS_PER_REQUEST = 4
+_request_slots = contextvars.ContextVar('request_slots', default=None)
+
+def _guarded_call(breaker, func, *args, **kwargs):
+    """Run an upstream call through its circuit breaker and the invocation's call slots"""
+    slots = _request_slots.get()
+    try:
+        if slots is None:
+            return breaker.call(func, *args, **kwargs)
+        with slots:
+            return breaker.call(func, *args, **kwargs)
+    except pybreaker.CircuitBreakerError:
+        raise RuntimeError(f"{breaker.name} temporarily unavailable")
+
+def fdic_get(url, **kwargs):
+    """GET against the FDIC API, guarded by FDIC_BREAKER"""
+    return _guarded_call(FDIC_BREAKER, http.get, url, timeout=UPSTREAM_TIMEOUT, **kwargs)
+
+def sec_get(url, **kwargs):
+    """GET against SEC EDGAR, guarded by SEC_BREAKER"""
+    return _guarded_call(SEC_BREAKER, http.get, url, timeout=UPSTREAM_TIMEOUT, **kwargs)
+
+# Corporate suffixes stripped before fuzzy-matching a bank against FDIC names
+_CORP_SUFFIX_RE = re.compile(r'\b(CORP|INC|CO|GROUP|FINANCIAL|BANCORP)\b')
+
+# CERT numbers never change for a given bank, so name -> CERT lookups are cached for 90 days
+CERT_CACHE_TTL = 90 * 86400
+
+# Known bank CERT numbers (fallback if search fails)
+BANK_CERTS = {
+    "JPMorgan Chase": "628", "JPMORGAN CHASE BANK": "628",
+    "Bank of America": "3510", "BANK OF AMERICA": "3510",
+    "Wells Fargo": "3511", "WELLS FARGO BANK": "3511",
+    "Citigroup": "7213", "CITIBANK": "7213",
+    "Goldman Sachs": "33124", "GOLDMAN SACHS BANK": "33124",
+    "Morgan Stanley": "65012",
+    "U.S. Bancorp": "6548", "U.S. BANK": "6548",
+    "PNC Financial": "6384", "PNC BANK": "6384",
+    "Capital One": "4297", "CAPITAL ONE": "4297",
+    "Truist Financial": "14291", "TRUIST BANK": "14291",
+    "Regions Financial": "12368", "REGIONS FINANCIAL CORP": "12368",
+    "Fifth Third Bancorp": "6672", "FIFTH THIRD BANCORP": "6672"
+}
+
+# Regulatory alerts included in every regulatory_alerts_monitor response
+STANDARD_ALERTS = (
+    {
+        "severity": "Low",
+        "category": "Compliance",
+        "message": "Annual stress test results pending review",
+        "regulation": "CCAR"
+    },
+    {
+        "severity": "Medium",
+        "category": "Risk Management",
+        "message": "Credit risk concentration requires monitoring",
+        "regulation": "OCC Guidelines"
+    },
+)
+
 # ============================================================================
 # BANKING DATA TOOLS
 # ============================================================================
@@ -33,7 +114,7 @@ def get_fdic_data() -> str:
             "format": "json"
         }
         
-        response = requests.get(url, params=params, timeout=10)
+        response = fdic_get(url, params=params)
         if response.status_code == 200:
             data = response.json()
             return json.dumps({"success": True, "data": data.get("data", [])[:20]})
@@ -54,17 +135,32 @@ def get_bank_fdic_data(bank_name: str) -> str:
     Examples: "Get FDIC data for Wells Fargo", "Compliance data for JPMorgan"""
     try:
         # First, find the bank's CERT number
-        cert_result = search_fdic_bank(bank_name)
-        cert_data = json.loads(cert_result)
+        cert_number = _resolve_cert(bank_name)
         
-        if not cert_data.get('success'):
+        if not cert_number:
             return json.dumps({"success": False, "error": "Bank not found"})
         
-        cert_number = cert_data['cert']
-        
-        # Get financial data using CERT number
-        # First, get total count to calculate offset for most recent data
+        # Get the 20 most recent quarters using CERT number - FDIC sorts server-side
         url = "https://api.fdic.gov/banks/financials"
+        fields = "ASSET,DEP,NETINC,ROA,ROE,EQTOT,LNLSNET,NCLNLS,LNATRES,RBCT1J,NIMY"
+        params = {
+            "filters": f"CERT:{cert_number}",
+            "fields": fields,
+            "sort_by": "REPDTE",
+            "sort_order": "DESC",
+            "limit": 20,
+            "format": "json"
+        }
+        
+        response = fdic_get(url, params=params)
+        if response.status_code == 200:
+            # Oldest first, so callers can keep using records[-1] as most recent
+            data = response.json().get("data", [])
+            return json.dumps({"success": True, "data": data[::-1]})
+        if response.status_code != 400:
+            return json.dumps({"success": False, "error": f"FDIC API error: {response.status_code}"})
+        
+        # Sort rejected - fall back to counting records and offsetting to the newest 20
         count_params = {
             "filters": f"CERT:{cert_number}",
             "fields": "ASSET",
@@ -72,7 +168,7 @@ def get_bank_fdic_data(bank_name: str) -> str:
             "format": "json"
         }
         
-        count_response = requests.get(url, params=count_params, timeout=10)
+        count_response = fdic_get(url, params=count_params)
         if count_response.status_code != 200:
             return json.dumps({"success": False, "error": f"FDIC API error: {count_response.status_code}"})
         
@@ -83,13 +179,13 @@ def get_bank_fdic_data(bank_name: str) -> str:
         
         params = {
             "filters": f"CERT:{cert_number}",
-            "fields": "ASSET,DEP,NETINC,ROA,ROE,EQTOT,LNLSNET,NCLNLS,LNATRES,RBCT1J,NIMY",
+            "fields": fields,
             "limit": 20,
             "offset": offset,
             "format": "json"
         }
         
-        response = requests.get(url, params=params, timeout=10)
+        response = fdic_get(url, params=params)
         if response.status_code == 200:
             data = response.json()
             return json.dumps({"success": True, "data": data.get("data", [])})
@@ -133,7 +229,7 @@ def search_fdic_bank(bank_name: str) -> str:
         
         for term in search_terms:
             url = f"https://api.fdic.gov/banks/institutions?search=NAME:{term}&fields=CERT,NAME,ASSET,ACTIVE&limit=50&format=json"
-            response = requests.get(url, timeout=10)
+            response = fdic_get(url)
             if response.status_code == 200:
                 data = response.json().get("data", [])
                 if data:
@@ -154,6 +250,27 @@ def search_fdic_bank(bank_name: str) -> str:
     except Exception as e:
         return json.dumps({"success": False, "error": str(e)})
 
+def _cert_cache_key(bank_name):
+    """Normalize a bank name so "JPMorgan Chase & Co" and "JPMORGAN CHASE" share a cache entry"""
+    return ' '.join(_CORP_SUFFIX_RE.sub('', bank_name.upper()).replace('&', ' ').split())
+
+# Seed from the static table so the top banks never need an FDIC lookup (CERTs never expire)
+_cert_cache = {_cert_cache_key(name): (cert, float('inf')) for name, cert in BANK_CERTS.items()}
+
+def _resolve_cert(bank_name):
+    """Resolve a bank name to its FDIC CERT number, using the long-TTL cache"""
+    key = _cert_cache_key(bank_name)
+    cached = _cert_cache.get(key)
+    if cached and cached[1] > time.time():
+        return cached[0]
+    
+    result = json.loads(search_fdic_bank(bank_name))
+    if not result.get('success'):
+        return None
+    
+    _cert_cache[key] = (result['cert'], time.time() + CERT_CACHE_TTL)
+    return result['cert']
+
 @tool
 def compare_banks_live_fdic(base_bank: str, peer_banks: List[str], metric: str) -> str:
     """Compare banks using LIVE FDIC data - real-time peer analysis.
@@ -210,20 +327,7 @@ def compare_banks(base_bank: str, peer_banks: List[str], metric: str) -> str:
     Use when: Never use directly - use compare_banks_live_fdic or compare_banks_local_csv"""
     
     # Bank CERT numbers cache (fallback if search fails)
-    bank_certs_cache = {
-        "JPMorgan Chase": "628", "JPMORGAN CHASE BANK": "628",
-        "Bank of America": "3510", "BANK OF AMERICA": "3510",
-        "Wells Fargo": "3511", "WELLS FARGO BANK": "3511",
-        "Citigroup": "7213", "CITIBANK": "7213",
-        "Goldman Sachs": "33124", "GOLDMAN SACHS BANK": "33124",
-        "Morgan Stanley": "65012",
-        "U.S. Bancorp": "6548", "U.S. BANK": "6548",
-        "PNC Financial": "6384", "PNC BANK": "6384",
-        "Capital One": "4297", "CAPITAL ONE": "4297",
-        "Truist Financial": "14291", "TRUIST BANK": "14291",
-        "Regions Financial": "12368", "REGIONS FINANCIAL CORP": "12368",
-        "Fifth Third Bancorp": "6672", "FIFTH THIRD BANCORP": "6672"
-    }
+    bank_certs_cache = dict(BANK_CERTS)
     
     # Helper function to get CERT (try cache first, then search)
     def get_cert(bank_name):
@@ -281,8 +385,19 @@ def compare_banks(base_bank: str, peer_banks: List[str], metric: str) -> str:
             continue
             
         try:
-            url = f"https://api.fdic.gov/banks/financials?filters=CERT:{cert}&fields=ASSET,ROA,ROE,NIMY,EQTOT,DEP,LNLSNET,EINTEXP,NONII,NCRER&limit=200&format=json"
-            response = requests.get(url, timeout=10)
+            # Ask FDIC for only the 8 newest 2023-2025 quarters instead of filtering 200 rows locally
+            url = "https://api.fdic.gov/banks/financials"
+            response = fdic_get(url, params={
+                "filters": f"CERT:{cert} AND REPDTE:[20230101 TO 20251231]",
+                "fields": "ASSET,ROA,ROE,NIMY,EQTOT,DEP,LNLSNET,EINTEXP,NONII,NCRER,REPDTE",
+                "sort_by": "REPDTE",
+                "sort_order": "DESC",
+                "limit": 8,
+                "format": "json"
+            })
+            if response.status_code == 400:
+                # Range filter/sort rejected - fall back to client-side filtering
+                response = fdic_get(f"{url}?filters=CERT:{cert}&fields=ASSET,ROA,ROE,NIMY,EQTOT,DEP,LNLSNET,EINTEXP,NONII,NCRER&limit=200&format=json")
             if response.status_code != 200:
                 continue
                 
@@ -398,7 +513,7 @@ def get_sec_filings(bank_name: str, form_type: str = "10-K", cik: str = "") -> s
         headers = {"User-Agent": "BankIQ Analytics contact@bankiq.com"}
         url = f"https://data.sec.gov/submissions/CIK{target_cik}.json"
         
-        response = requests.get(url, headers=headers, timeout=10)
+        response = sec_get(url, headers=headers)
         if response.status_code != 200:
             return json.dumps({"success": False, "error": f"SEC API error: {response.status_code}"})
         
@@ -502,7 +617,7 @@ def search_banks(query: str) -> str:
         search_url = f"https://www.sec.gov/cgi-bin/browse-edgar?company={query}&owner=exclude&action=getcompany"
         
         try:
-            response = requests.get(search_url, headers=headers, timeout=10)
+            response = sec_get(search_url, headers=headers)
             
             # Parse HTML response to extract company info
             # Look for company name and CIK in the response
@@ -861,6 +976,110 @@ def extract_pdf_text(s3_key: str, bank_name: str) -> str:
             pass
 """
 
+def _camels_component_scores(tier1_ratio, equity, assets, npl, loans, allowance, roa, deposits, nim):
+    """Score the CAMELS components from raw FDIC metrics
+    
+    Returns: (capital_ratio, capital_score, npl_ratio, coverage_ratio, asset_quality_score,
+              earnings_score, ltd_ratio, liquidity_score, sensitivity_score)"""
+    # === CAPITAL ADEQUACY (25% weight) - Basel III aligned ===
+    # Use Tier 1 ratio if available, otherwise leverage ratio
+    if tier1_ratio > 0:
+        capital_ratio = tier1_ratio
+        # Basel III: 6% minimum, 8% well-capitalized, 10%+ strong
+        if capital_ratio >= 10:
+            capital_score = 95 + min(5, (capital_ratio - 10) * 0.5)
+        elif capital_ratio >= 8:
+            capital_score = 80 + (capital_ratio - 8) * 7.5
+        elif capital_ratio >= 6:
+            capital_score = 60 + (capital_ratio - 6) * 10
+        elif capital_ratio >= 4.5:
+            capital_score = 40 + (capital_ratio - 4.5) * 13.3
+        else:
+            capital_score = max(10, capital_ratio * 8.9)
+    else:
+        # Fallback: Leverage ratio (equity/assets)
+        capital_ratio = (equity / assets * 100) if assets > 0 else 0
+        # Leverage ratio: 4% minimum, 5% well-capitalized
+        if capital_ratio >= 8:
+            capital_score = 90 + min(10, (capital_ratio - 8) * 1.25)
+        elif capital_ratio >= 5:
+            capital_score = 70 + (capital_ratio - 5) * 6.7
+        elif capital_ratio >= 4:
+            capital_score = 50 + (capital_ratio - 4) * 20
+        else:
+            capital_score = max(10, capital_ratio * 12.5)
+    
+    # === ASSET QUALITY (25% weight) - NPL ratio based ===
+    npl_ratio = (npl / loans * 100) if loans > 0 else 0
+    coverage_ratio = (allowance / npl * 100) if npl > 0 else 100
+    
+    # NPL ratio: <1% excellent, 1-2% good, 2-3% adequate, >3% poor
+    if npl_ratio < 0.5:
+        npl_score = 95 + min(5, (0.5 - npl_ratio) * 10)
+    elif npl_ratio < 1.0:
+        npl_score = 85 + (1.0 - npl_ratio) * 20
+    elif npl_ratio < 2.0:
+        npl_score = 65 + (2.0 - npl_ratio) * 20
+    elif npl_ratio < 3.0:
+        npl_score = 45 + (3.0 - npl_ratio) * 20
+    else:
+        npl_score = max(10, 45 - (npl_ratio - 3.0) * 10)
+    
+    # Coverage ratio: >100% good, 70-100% adequate, <70% weak
+    if coverage_ratio >= 100:
+        coverage_score = 90 + min(10, (coverage_ratio - 100) * 0.1)
+    elif coverage_ratio >= 70:
+        coverage_score = 60 + (coverage_ratio - 70) * 1.0
+    else:
+        coverage_score = max(20, coverage_ratio * 0.86)
+    
+    asset_quality_score = (npl_score * 0.7 + coverage_score * 0.3)
+    
+    # === EARNINGS (20% weight) - ROA based ===
+    # ROA: >1.2% strong, 0.8-1.2% good, 0.4-0.8% adequate, <0.4% weak
+    if roa >= 1.5:
+        earnings_score = 90 + min(10, (roa - 1.5) * 6.7)
+    elif roa >= 1.2:
+        earnings_score = 80 + (roa - 1.2) * 33.3
+    elif roa >= 0.8:
+        earnings_score = 65 + (roa - 0.8) * 37.5
+    elif roa >= 0.4:
+        earnings_score = 45 + (roa - 0.4) * 50
+    elif roa >= 0:
+        earnings_score = max(20, roa * 112.5)
+    else:
+        earnings_score = 10
+    
+    # === LIQUIDITY (15% weight) - LTD ratio ===
+    ltd_ratio = (loans / deposits * 100) if deposits > 0 else 0
+    # Optimal: 70-85%, acceptable: 60-95%, concerning: >100%
+    if 70 <= ltd_ratio <= 85:
+        liquidity_score = 95 + min(5, (80 - abs(ltd_ratio - 77.5)) * 0.4)
+    elif 60 <= ltd_ratio < 70:
+        liquidity_score = 75 + (ltd_ratio - 60) * 2
+    elif 85 < ltd_ratio <= 95:
+        liquidity_score = 75 - (ltd_ratio - 85) * 2
+    elif 95 < ltd_ratio <= 100:
+        liquidity_score = 55 - (ltd_ratio - 95) * 4
+    elif ltd_ratio > 100:
+        liquidity_score = max(20, 35 - (ltd_ratio - 100) * 1.5)
+    else:
+        liquidity_score = max(40, 55 + (ltd_ratio - 50) * 2)
+    
+    # === SENSITIVITY TO MARKET RISK (15% weight) - NIM volatility proxy ===
+    # NIM: >3.5% strong, 2.5-3.5% good, 1.5-2.5% adequate, <1.5% weak
+    if nim >= 3.5:
+        sensitivity_score = 90 + min(10, (nim - 3.5) * 10)
+    elif nim >= 2.5:
+        sensitivity_score = 70 + (nim - 2.5) * 20
+    elif nim >= 1.5:
+        sensitivity_score = 50 + (nim - 1.5) * 20
+    else:
+        sensitivity_score = max(20, nim * 33.3)
+    
+    return (capital_ratio, capital_score, npl_ratio, coverage_ratio, asset_quality_score,
+            earnings_score, ltd_ratio, liquidity_score, sensitivity_score)
+
 @tool
 def compliance_risk_assessment(bank_name: str) -> str:
     """Perform real-time compliance risk assessment using FDIC data (October 2024 to October 2025).
@@ -911,101 +1130,9 @@ def compliance_risk_assessment(bank_name: str) -> str:
             tier1_ratio = tier1_raw
         nim = float(bank_data.get('NIMY', 0) or 0)  # Net Interest Margin
         
-        # === CAPITAL ADEQUACY (25% weight) - Basel III aligned ===
-        # Use Tier 1 ratio if available, otherwise leverage ratio
-        if tier1_ratio > 0:
-            capital_ratio = tier1_ratio
-            # Basel III: 6% minimum, 8% well-capitalized, 10%+ strong
-            if capital_ratio >= 10:
-                capital_score = 95 + min(5, (capital_ratio - 10) * 0.5)
-            elif capital_ratio >= 8:
-                capital_score = 80 + (capital_ratio - 8) * 7.5
-            elif capital_ratio >= 6:
-                capital_score = 60 + (capital_ratio - 6) * 10
-            elif capital_ratio >= 4.5:
-                capital_score = 40 + (capital_ratio - 4.5) * 13.3
-            else:
-                capital_score = max(10, capital_ratio * 8.9)
-        else:
-            # Fallback: Leverage ratio (equity/assets)
-            capital_ratio = (equity / assets * 100) if assets > 0 else 0
-            # Leverage ratio: 4% minimum, 5% well-capitalized
-            if capital_ratio >= 8:
-                capital_score = 90 + min(10, (capital_ratio - 8) * 1.25)
-            elif capital_ratio >= 5:
-                capital_score = 70 + (capital_ratio - 5) * 6.7
-            elif capital_ratio >= 4:
-                capital_score = 50 + (capital_ratio - 4) * 20
-            else:
-                capital_score = max(10, capital_ratio * 12.5)
-        
-        # === ASSET QUALITY (25% weight) - NPL ratio based ===
-        npl_ratio = (npl / loans * 100) if loans > 0 else 0
-        coverage_ratio = (allowance / npl * 100) if npl > 0 else 100
-        
-        # NPL ratio: <1% excellent, 1-2% good, 2-3% adequate, >3% poor
-        if npl_ratio < 0.5:
-            npl_score = 95 + min(5, (0.5 - npl_ratio) * 10)
-        elif npl_ratio < 1.0:
-            npl_score = 85 + (1.0 - npl_ratio) * 20
-        elif npl_ratio < 2.0:
-            npl_score = 65 + (2.0 - npl_ratio) * 20
-        elif npl_ratio < 3.0:
-            npl_score = 45 + (3.0 - npl_ratio) * 20
-        else:
-            npl_score = max(10, 45 - (npl_ratio - 3.0) * 10)
-        
-        # Coverage ratio: >100% good, 70-100% adequate, <70% weak
-        if coverage_ratio >= 100:
-            coverage_score = 90 + min(10, (coverage_ratio - 100) * 0.1)
-        elif coverage_ratio >= 70:
-            coverage_score = 60 + (coverage_ratio - 70) * 1.0
-        else:
-            coverage_score = max(20, coverage_ratio * 0.86)
-        
-        asset_quality_score = (npl_score * 0.7 + coverage_score * 0.3)
-        
-        # === EARNINGS (20% weight) - ROA based ===
-        # ROA: >1.2% strong, 0.8-1.2% good, 0.4-0.8% adequate, <0.4% weak
-        if roa >= 1.5:
-            earnings_score = 90 + min(10, (roa - 1.5) * 6.7)
-        elif roa >= 1.2:
-            earnings_score = 80 + (roa - 1.2) * 33.3
-        elif roa >= 0.8:
-            earnings_score = 65 + (roa - 0.8) * 37.5
-        elif roa >= 0.4:
-            earnings_score = 45 + (roa - 0.4) * 50
-        elif roa >= 0:
-            earnings_score = max(20, roa * 112.5)
-        else:
-            earnings_score = 10
-        
-        # === LIQUIDITY (15% weight) - LTD ratio ===
-        ltd_ratio = (loans / deposits * 100) if deposits > 0 else 0
-        # Optimal: 70-85%, acceptable: 60-95%, concerning: >100%
-        if 70 <= ltd_ratio <= 85:
-            liquidity_score = 95 + min(5, (80 - abs(ltd_ratio - 77.5)) * 0.4)
-        elif 60 <= ltd_ratio < 70:
-            liquidity_score = 75 + (ltd_ratio - 60) * 2
-        elif 85 < ltd_ratio <= 95:
-            liquidity_score = 75 - (ltd_ratio - 85) * 2
-        elif 95 < ltd_ratio <= 100:
-            liquidity_score = 55 - (ltd_ratio - 95) * 4
-        elif ltd_ratio > 100:
-            liquidity_score = max(20, 35 - (ltd_ratio - 100) * 1.5)
-        else:
-            liquidity_score = max(40, 55 + (ltd_ratio - 50) * 2)
-        
-        # === SENSITIVITY TO MARKET RISK (15% weight) - NIM volatility proxy ===
-        # NIM: >3.5% strong, 2.5-3.5% good, 1.5-2.5% adequate, <1.5% weak
-        if nim >= 3.5:
-            sensitivity_score = 90 + min(10, (nim - 3.5) * 10)
-        elif nim >= 2.5:
-            sensitivity_score = 70 + (nim - 2.5) * 20
-        elif nim >= 1.5:
-            sensitivity_score = 50 + (nim - 1.5) * 20
-        else:
-            sensitivity_score = max(20, nim * 33.3)
+        (capital_ratio, capital_score, npl_ratio, coverage_ratio, asset_quality_score,
+         earnings_score, ltd_ratio, liquidity_score, sensitivity_score) = _camels_component_scores(
+            tier1_ratio, equity, assets, npl, loans, allowance, roa, deposits, nim)
         
         # === CAMELS-INSPIRED WEIGHTED SCORE ===
         overall_score = (
@@ -1097,16 +1224,18 @@ def regulatory_alerts_monitor(bank_name: str) -> str:
         if fdic_data.get('success'):
             # Find bank data with flexible matching
             bank_data = None
-            bank_name_clean = bank_name.upper().replace(' CORP', '').replace(' INC', '').replace(' & CO', '').replace(' GROUP', '').replace(' FINANCIAL', '').replace(' BANCORP', '').strip()
+            bank_name_upper = bank_name.upper()
+            bank_name_clean = ' '.join(_CORP_SUFFIX_RE.sub('', bank_name_upper).replace('&', ' ').split())
+            
+            # Build one alternation (full name, cleaned name, significant words) so each
+            # FDIC name is checked with a single regex search instead of a word-by-word scan
+            candidates = {bank_name_upper, bank_name_clean} | {w for w in bank_name_clean.split() if len(w) > 3}
+            candidates.discard('')
+            probe = re.compile('|'.join(map(re.escape, sorted(candidates, key=len, reverse=True))))
             
             for bank in fdic_data['data']:
                 bank_fdic_name = bank.get('NAME', '').upper()
-                # Try exact match first
-                if bank_name.upper() in bank_fdic_name or bank_fdic_name in bank_name.upper():
-                    bank_data = bank
-                    break
-                # Try cleaned name match
-                elif bank_name_clean in bank_fdic_name or any(word in bank_fdic_name for word in bank_name_clean.split() if len(word) > 3):
+                if probe.search(bank_fdic_name) or (bank_fdic_name and bank_fdic_name in bank_name_upper):
                     bank_data = bank
                     break
             
@@ -1134,28 +1263,14 @@ def regulatory_alerts_monitor(bank_name: str) -> str:
                     })
         
         # Add standard regulatory alerts (always include these)
-        alerts.extend([
-            {
-                "severity": "Low",
-                "category": "Compliance",
-                "message": "Annual stress test results pending review",
-                "regulation": "CCAR"
-            },
-            {
-                "severity": "Medium",
-                "category": "Risk Management",
-                "message": "Credit risk concentration requires monitoring",
-                "regulation": "OCC Guidelines"
-            },
-            {
-                "severity": "Info",
-                "category": "Regulatory",
-                "message": f"Compliance monitoring active for {bank_name}",
-                "regulation": "FDIC Guidelines"
-            }
-        ])
+        monitoring_alert = {
+            "severity": "Info",
+            "category": "Regulatory",
+            "message": f"Compliance monitoring active for {bank_name}",
+            "regulation": "FDIC Guidelines"
+        }
         
-        return json.dumps({"success": True, "alerts": alerts})
+        return json.dumps({"success": True, "alerts": [*alerts, *STANDARD_ALERTS, monitoring_alert]})
         
     except Exception as e:
         return json.dumps({"success": False, "error": str(e)})
@@ -1227,7 +1342,9 @@ def query_rag_knowledge_base(question: str, bank_name: str) -> str:
         query = f"For {bank_name}: {question}"
         
         # ONLY retrieve documents - NO generation
-        response = bedrock_agent.retrieve(
+        response = _guarded_call(
+            BEDROCK_BREAKER,
+            bedrock_agent.retrieve,
             knowledgeBaseId=kb_id,
             retrievalQuery={'text': query},
             retrievalConfiguration={
@@ -1461,6 +1578,18 @@ Be professional and business-focused."""
 async def invoke(payload):
     """AgentCore entrypoint with streaming support"""
     user_message = payload.get("prompt", "Hello! I'm BankIQ+, your banking analyst.")
+    # Obvious guardrail hit - answer locally instead of round-tripping to Bedrock.
+    # Never log the prompt here: on the PII path it holds the very data being blocked.
+    if should_short_circuit(user_message):
+        print("[AGENT] Blocked by guardrail prefilter (phrase)")
+        yield {"data": BLOCKED_INPUT_MESSAGE}
+        return
+    if contains_blocked_pii(user_message):
+        print("[AGENT] Blocked by guardrail prefilter (pii)")
+        yield {"data": BLOCKED_INPUT_MESSAGE}
+        return
+    # Tool threads inherit this context, bounding this invocation's outbound fan-out
+    _request_slots.set(threading.BoundedSemaphore(MAX_UPSTREAM_CALLS_PER_REQUEST))
     print(f"[AGENT] Streaming for: {user_message[:50]}")
     stream = agent.stream_async(user_message)
     async for event in stream:
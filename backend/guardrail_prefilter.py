@@ -0,0 +1,28 @@
+"""Local pre-filter for the BankIQ+ Bedrock guardrail's blocked phrases
+
+Mirrors the wordPolicyConfig in cfn/scripts/create-bedrock-guardrail.py so prompts
+containing an obviously blocked phrase are rejected in-process, without paying for
+a model + guardrail round trip. Keep BLOCKED_PHRASES in sync with that script.
+"""
+import re
+
+BLOCKED_PHRASES = (
+    'buy this stock',
+    'sell this stock',
+    'guaranteed returns',
+    'risk-free investment',
+    'get rich quick',
+    'insider tip',
+    'hot stock',
+    'sure thing'
+)
+
+# Same text as the guardrail's blockedInputMessaging
+BLOCKED_INPUT_MESSAGE = 'I can only provide banking data analysis. I cannot provide financial advice, investment recommendations, or discuss inappropriate topics. Please ask about banking metrics, financial data, or regulatory compliance.'
+
+# Single alternation compiled once at import - one C-level scan per prompt
+PREFILTER = re.compile(r'\b(?:' + '|'.join(re.escape(p) for p in BLOCKED_PHRASES) + r')\b', re.IGNORECASE)
+
+def should_short_circuit(prompt: str) -> bool:
+    """True if the prompt contains a blocked phrase and can be rejected without calling Bedrock"""
+    return PREFILTER.search(prompt) is not None
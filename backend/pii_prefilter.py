@@ -0,0 +1,25 @@
+"""Local pre-filter for PII the BankIQ+ Bedrock guardrail blocks outright
+
+The guardrail's sensitiveInformationPolicyConfig BLOCKs SSNs and card numbers, so a
+prompt containing one is rejected locally without a Bedrock round trip. Entities the
+guardrail only ANONYMIZEs (email, phone, name, address) are left to Bedrock.
+"""
+import re
+
+# Dashed SSN only - undashed 9-digit runs are indistinguishable from dollar amounts
+SSN_RE = re.compile(r'\b\d{3}-\d{2}-\d{4}\b', re.MULTILINE)
+
+# Visa / Mastercard / Amex / Discover prefixes, optionally grouped with spaces or dashes
+CARD_RE = re.compile(r'\b(?:4\d{3}|5[1-5]\d{2}|3[47]\d{2}|6011)(?:[ -]?\d{4}){2}[ -]?\d{3,4}\b', re.MULTILINE)
+
+def _luhn_valid(number: str) -> bool:
+    """Luhn checksum, so arbitrary 15-16 digit figures aren't treated as cards"""
+    digits = [int(d) for d in number if d.isdigit()]
+    checksum = sum(digits[-1::-2]) + sum(sum(divmod(d * 2, 10)) for d in digits[-2::-2])
+    return checksum % 10 == 0
+
+def contains_blocked_pii(prompt: str) -> bool:
+    """True if the prompt contains PII the guardrail would block"""
+    if SSN_RE.search(prompt):
+        return True
+    return any(_luhn_valid(m.group(0)) for m in CARD_RE.finditer(prompt))
@@ -5,8 +5,217 @@ Protects against harmful content, financial advice, and inappropriate requests
 """
 
 import boto3
+import functools
+import hashlib
 import json
+import os
 import sys
+import tempfile
+import types
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import jsonschema
+except ImportError:
+    jsonschema = None
+
+GUARDRAIL_CONFIG_PATH = '/tmp/guardrail_config.json'
+
+# Blocked words/phrases - keep in sync with backend/guardrail_prefilter.py,
+# which rejects these locally before a prompt ever reaches Bedrock
+BLOCKED_PHRASES = (
+    'buy this stock',
+    'sell this stock',
+    'guaranteed returns',
+    'risk-free investment',
+    'get rich quick',
+    'insider tip',
+    'hot stock',
+    'sure thing'
+)
+
+# Guardrail policy config, built once at import and never mutated
+_GUARDRAIL_SPEC = types.MappingProxyType(dict(
+    # Content Policy - Filter harmful content
+    contentPolicyConfig={
+        'filtersConfig': [
+            {
+                'type': 'HATE',
+                'inputStrength': 'HIGH',
+                'outputStrength': 'HIGH'
+            },
+            {
+                'type': 'INSULTS',
+                'inputStrength': 'HIGH',
+                'outputStrength': 'HIGH'
+            },
+            {
+                'type': 'SEXUAL',
+                'inputStrength': 'HIGH',
+                'outputStrength': 'HIGH'
+            },
+            {
+                'type': 'VIOLENCE',
+                'inputStrength': 'HIGH',
+                'outputStrength': 'HIGH'
+            },
+            {
+                'type': 'MISCONDUCT',
+                'inputStrength': 'MEDIUM',
+                'outputStrength': 'MEDIUM'
+            },
+            {
+                'type': 'PROMPT_ATTACK',
+                'inputStrength': 'HIGH',
+                'outputStrength': 'NONE'
+            }
+        ]
+    },
+    
+    # Topic Policy - Block specific topics
+    topicPolicyConfig={
+        'topicsConfig': [
+            {
+                'name': 'FinancialAdvice',
+                'definition': 'Providing investment recommendations, stock picks, buy/sell advice, portfolio allocation suggestions, or personalized financial planning guidance',
+                'examples': [
+                    'Should I buy this stock?',
+                    'What stocks should I invest in?',
+                    'Is this a good time to sell?',
+                    'How should I allocate my portfolio?',
+                    'Which bank stock will perform best?'
+                ],
+                'type': 'DENY'
+            },
+            {
+                'name': 'LegalAdvice',
+                'definition': 'Providing legal counsel, regulatory compliance advice, or interpretation of laws and regulations',
+                'examples': [
+                    'Can I sue this bank?',
+                    'What are my legal rights?',
+                    'How do I comply with this regulation?'
+                ],
+                'type': 'DENY'
+            },
+            {
+                'name': 'TaxAdvice',
+                'definition': 'Providing tax planning advice, tax optimization strategies, or tax filing guidance',
+                'examples': [
+                    'How can I reduce my taxes?',
+                    'What tax deductions can I claim?',
+                    'Should I use this tax strategy?'
+                ],
+                'type': 'DENY'
+            },
+            {
+                'name': 'PersonalFinance',
+                'definition': 'Providing personalized financial planning, budgeting advice, or debt management strategies',
+                'examples': [
+                    'How much should I save?',
+                    'Should I pay off my mortgage?',
+                    'How do I manage my debt?'
+                ],
+                'type': 'DENY'
+            }
+        ]
+    },
+    
+    # Word Policy - Block specific words/phrases
+    wordPolicyConfig={
+        'wordsConfig': [{'text': phrase} for phrase in BLOCKED_PHRASES],
+        'managedWordListsConfig': [
+            {'type': 'PROFANITY'}
+        ]
+    },
+    
+    # Sensitive Information Policy - Redact PII
+    sensitiveInformationPolicyConfig={
+        'piiEntitiesConfig': [
+            {'type': 'US_SOCIAL_SECURITY_NUMBER', 'action': 'BLOCK'},
+            {'type': 'CREDIT_DEBIT_CARD_NUMBER', 'action': 'BLOCK'},
+            {'type': 'US_BANK_ACCOUNT_NUMBER', 'action': 'BLOCK'},
+            {'type': 'US_BANK_ROUTING_NUMBER', 'action': 'BLOCK'},
+            {'type': 'EMAIL', 'action': 'ANONYMIZE'},
+            {'type': 'PHONE', 'action': 'ANONYMIZE'},
+            {'type': 'NAME', 'action': 'ANONYMIZE'},
+            {'type': 'ADDRESS', 'action': 'ANONYMIZE'}
+        ]
+    },
+    
+    blockedInputMessaging='I can only provide banking data analysis. I cannot provide financial advice, investment recommendations, or discuss inappropriate topics. Please ask about banking metrics, financial data, or regulatory compliance.',
+    blockedOutputsMessaging='I cannot provide that type of information. I can only assist with factual banking data analysis and metrics.'
+))
+
+# Minimal shape check for the spec - catches typos before a Bedrock round trip
+GUARDRAIL_SPEC_SCHEMA = {
+    'type': 'object',
+    'required': [
+        'contentPolicyConfig', 'topicPolicyConfig', 'wordPolicyConfig',
+        'sensitiveInformationPolicyConfig', 'blockedInputMessaging', 'blockedOutputsMessaging'
+    ],
+    'properties': {
+        'contentPolicyConfig': {'type': 'object', 'required': ['filtersConfig']},
+        'topicPolicyConfig': {'type': 'object', 'required': ['topicsConfig']},
+        'wordPolicyConfig': {'type': 'object'},
+        'sensitiveInformationPolicyConfig': {'type': 'object'},
+        'blockedInputMessaging': {'type': 'string', 'minLength': 1, 'maxLength': 500},
+        'blockedOutputsMessaging': {'type': 'string', 'minLength': 1, 'maxLength': 500}
+    },
+    'additionalProperties': False
+}
+
+GUARDRAIL_NAME = 'bankiq-guardrail'
+GUARDRAIL_DESCRIPTION = 'Content filtering and safety guardrail for BankIQ+ banking analytics platform'
+
+@functools.lru_cache(maxsize=1)
+def _validator():
+    return jsonschema.Draft202012Validator(GUARDRAIL_SPEC_SCHEMA)
+
+def validate_spec(spec):
+    """Validate the guardrail spec against GUARDRAIL_SPEC_SCHEMA (skipped if jsonschema is not installed)"""
+    if jsonschema is not None:
+        _validator().validate(spec)
+
+def guardrail_config_hash(spec):
+    """Short stable hash of the guardrail config, used to detect drift between runs"""
+    return hashlib.blake2b(json.dumps(spec, sort_keys=True).encode(), digest_size=8).hexdigest()
+
+def find_guardrail(client, name):
+    """Return the summary of the guardrail with this name, or None"""
+    for page in client.get_paginator('list_guardrails').paginate():
+        for guardrail in page.get('guardrails', []):
+            if guardrail['name'] == name:
+                return guardrail
+    return None
+
+def latest_guardrail_version(client, guardrail_id):
+    """Summary of the highest published (non-DRAFT) version of a guardrail, or None"""
+    versions = [
+        guardrail
+        for page in client.get_paginator('list_guardrails').paginate(guardrailIdentifier=guardrail_id)
+        for guardrail in page.get('guardrails', [])
+        if guardrail['version'] != 'DRAFT'
+    ]
+    return max(versions, key=lambda guardrail: int(guardrail['version'])) if versions else None
+
+def print_lines(lines):
+    """Emit a multi-line block with a single stdout write"""
+    sys.stdout.write('\n'.join(lines) + '\n')
+
+def write_config(config, path=GUARDRAIL_CONFIG_PATH):
+    """Write config JSON to a temp file and rename it into place, so readers never see a partial file"""
+    if orjson:
+        payload = orjson.dumps(config, option=orjson.OPT_INDENT_2)
+    else:
+        payload = json.dumps(config, indent=2).encode('utf-8')
+    
+    with tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(path), delete=False) as tf:
+        tf.write(payload)
+    os.replace(tf.name, path)
 
 def create_guardrail():
     """Create Bedrock Guardrail with comprehensive protections"""
@@ -16,156 +225,71 @@ def create_guardrail():
     print("Creating BankIQ+ Bedrock Guardrail...")
     print("=" * 60)
     
+    # Embed a hash of the config in the description so re-runs can detect an identical guardrail
+    guardrail_spec = dict(_GUARDRAIL_SPEC)
+    cfg_hash = guardrail_config_hash(guardrail_spec)
+    description = f'{GUARDRAIL_DESCRIPTION} [config {cfg_hash}]'
+    
     try:
-        response = client.create_guardrail(
-            name='bankiq-guardrail',
-            description='Content filtering and safety guardrail for BankIQ+ banking analytics platform',
-            
-            # Content Policy - Filter harmful content
-            contentPolicyConfig={
-                'filtersConfig': [
-                    {
-                        'type': 'HATE',
-                        'inputStrength': 'HIGH',
-                        'outputStrength': 'HIGH'
-                    },
-                    {
-                        'type': 'INSULTS',
-                        'inputStrength': 'HIGH',
-                        'outputStrength': 'HIGH'
-                    },
-                    {
-                        'type': 'SEXUAL',
-                        'inputStrength': 'HIGH',
-                        'outputStrength': 'HIGH'
-                    },
-                    {
-                        'type': 'VIOLENCE',
-                        'inputStrength': 'HIGH',
-                        'outputStrength': 'HIGH'
-                    },
-                    {
-                        'type': 'MISCONDUCT',
-                        'inputStrength': 'MEDIUM',
-                        'outputStrength': 'MEDIUM'
-                    },
-                    {
-                        'type': 'PROMPT_ATTACK',
-                        'inputStrength': 'HIGH',
-                        'outputStrength': 'NONE'
-                    }
-                ]
-            },
-            
-            # Topic Policy - Block specific topics
-            topicPolicyConfig={
-                'topicsConfig': [
-                    {
-                        'name': 'FinancialAdvice',
-                        'definition': 'Providing investment recommendations, stock picks, buy/sell advice, portfolio allocation suggestions, or personalized financial planning guidance',
-                        'examples': [
-                            'Should I buy this stock?',
-                            'What stocks should I invest in?',
-                            'Is this a good time to sell?',
-                            'How should I allocate my portfolio?',
-                            'Which bank stock will perform best?'
-                        ],
-                        'type': 'DENY'
-                    },
-                    {
-                        'name': 'LegalAdvice',
-                        'definition': 'Providing legal counsel, regulatory compliance advice, or interpretation of laws and regulations',
-                        'examples': [
-                            'Can I sue this bank?',
-                            'What are my legal rights?',
-                            'How do I comply with this regulation?'
-                        ],
-                        'type': 'DENY'
-                    },
-                    {
-                        'name': 'TaxAdvice',
-                        'definition': 'Providing tax planning advice, tax optimization strategies, or tax filing guidance',
-                        'examples': [
-                            'How can I reduce my taxes?',
-                            'What tax deductions can I claim?',
-                            'Should I use this tax strategy?'
-                        ],
-                        'type': 'DENY'
-                    },
-                    {
-                        'name': 'PersonalFinance',
-                        'definition': 'Providing personalized financial planning, budgeting advice, or debt management strategies',
-                        'examples': [
-                            'How much should I save?',
-                            'Should I pay off my mortgage?',
-                            'How do I manage my debt?'
-                        ],
-                        'type': 'DENY'
-                    }
-                ]
-            },
-            
-            # Word Policy - Block specific words/phrases
-            wordPolicyConfig={
-                'wordsConfig': [
-                    {'text': 'buy this stock'},
-                    {'text': 'sell this stock'},
-                    {'text': 'guaranteed returns'},
-                    {'text': 'risk-free investment'},
-                    {'text': 'get rich quick'},
-                    {'text': 'insider tip'},
-                    {'text': 'hot stock'},
-                    {'text': 'sure thing'}
-                ],
-                'managedWordListsConfig': [
-                    {'type': 'PROFANITY'}
-                ]
-            },
-            
-            # Sensitive Information Policy - Redact PII
-            sensitiveInformationPolicyConfig={
-                'piiEntitiesConfig': [
-                    {'type': 'US_SOCIAL_SECURITY_NUMBER', 'action': 'BLOCK'},
-                    {'type': 'CREDIT_DEBIT_CARD_NUMBER', 'action': 'BLOCK'},
-                    {'type': 'US_BANK_ACCOUNT_NUMBER', 'action': 'BLOCK'},
-                    {'type': 'US_BANK_ROUTING_NUMBER', 'action': 'BLOCK'},
-                    {'type': 'EMAIL', 'action': 'ANONYMIZE'},
-                    {'type': 'PHONE', 'action': 'ANONYMIZE'},
-                    {'type': 'NAME', 'action': 'ANONYMIZE'},
-                    {'type': 'ADDRESS', 'action': 'ANONYMIZE'}
-                ]
-            },
+        validate_spec(guardrail_spec)
+        existing = find_guardrail(client, GUARDRAIL_NAME)
+        version_number = None
+        
+        if existing and cfg_hash in existing.get('description', ''):
+            # Same config already deployed - reuse it instead of creating another version
+            guardrail_id = existing['id']
+            guardrail_arn = existing['arn']
+            # Only reuse the published version if it was cut from this config; a run that updated
+            # DRAFT but failed before create_guardrail_version leaves an older version behind
+            latest = latest_guardrail_version(client, guardrail_id)
+            if latest and cfg_hash in latest.get('description', ''):
+                version_number = latest['version']
+            print(f"✅ Guardrail unchanged (config {cfg_hash}), reusing existing guardrail")
+            print(f"   ID: {guardrail_id}")
+            print(f"   ARN: {guardrail_arn}")
+            print()
+        else:
+            if existing:
+                print(f"Guardrail config changed, updating {existing['id']}...")
+                response = client.update_guardrail(
+                    guardrailIdentifier=existing['id'],
+                    name=GUARDRAIL_NAME,
+                    description=description,
+                    **guardrail_spec
+                )
+            else:
+                response = client.create_guardrail(
+                    name=GUARDRAIL_NAME,
+                    description=description,
+                    **guardrail_spec,
+                    tags=[
+                        {'key': 'Project', 'value': 'BankIQ'},
+                        {'key': 'Environment', 'value': 'Production'},
+                        {'key': 'Purpose', 'value': 'ContentSafety'}
+                    ]
+                )
             
-            blockedInputMessaging='I can only provide banking data analysis. I cannot provide financial advice, investment recommendations, or discuss inappropriate topics. Please ask about banking metrics, financial data, or regulatory compliance.',
-            blockedOutputsMessaging='I cannot provide that type of information. I can only assist with factual banking data analysis and metrics.',
+            guardrail_id = response['guardrailId']
+            guardrail_arn = response['guardrailArn']
+            version = response['version']
             
-            tags=[
-                {'key': 'Project', 'value': 'BankIQ'},
-                {'key': 'Environment', 'value': 'Production'},
-                {'key': 'Purpose', 'value': 'ContentSafety'}
-            ]
-        )
-        
-        guardrail_id = response['guardrailId']
-        guardrail_arn = response['guardrailArn']
-        version = response['version']
-        
-        print(f"✅ Guardrail created successfully!")
-        print(f"   ID: {guardrail_id}")
-        print(f"   ARN: {guardrail_arn}")
-        print(f"   Version: {version}")
-        print()
+            print(f"✅ Guardrail {'updated' if existing else 'created'} successfully!")
+            print(f"   ID: {guardrail_id}")
+            print(f"   ARN: {guardrail_arn}")
+            print(f"   Version: {version}")
+            print()
         
-        # Create a version (required for use)
-        print("Creating guardrail version...")
-        version_response = client.create_guardrail_version(
-            guardrailIdentifier=guardrail_id,
-            description='Initial production version'
-        )
-        
-        version_number = version_response['version']
-        print(f"✅ Version created: {version_number}")
-        print()
+        if version_number is None:
+            # Create a version (required for use)
+            print("Creating guardrail version...")
+            version_response = client.create_guardrail_version(
+                guardrailIdentifier=guardrail_id,
+                description=f'Production version (config {cfg_hash})'
+            )
+            
+            version_number = version_response['version']
+            print(f"✅ Version created: {version_number}")
+            print()
         
         # Save configuration
         config = {
@@ -174,27 +298,28 @@ def create_guardrail():
             'version': version_number
         }
         
-        with open('/tmp/guardrail_config.json', 'w') as f:
-            json.dump(config, f, indent=2)
+        write_config(config)
         
-        print("=" * 60)
-        print("📋 NEXT STEPS:")
-        print("=" * 60)
-        print()
-        print("1. Update your agent configuration:")
-        print(f"   Add to backend/.bedrock_agentcore.yaml:")
-        print(f"   guardrail:")
-        print(f"     identifier: {guardrail_id}")
-        print(f"     version: '{version_number}'")
-        print()
-        print("2. Redeploy agent:")
-        print("   cd backend && agentcore launch -auc")
-        print()
-        print("3. Test guardrail:")
-        print('   agentcore invoke \'{"prompt": "Should I buy JPMorgan stock?"}\'')
-        print("   Expected: Blocked with custom message")
-        print()
-        print(f"Configuration saved to: /tmp/guardrail_config.json")
+        print_lines([
+            "=" * 60,
+            "📋 NEXT STEPS:",
+            "=" * 60,
+            "",
+            "1. Update your agent configuration:",
+            "   Add to backend/.bedrock_agentcore.yaml:",
+            "   guardrail:",
+            f"     identifier: {guardrail_id}",
+            f"     version: '{version_number}'",
+            "",
+            "2. Redeploy agent:",
+            "   cd backend && agentcore launch -auc",
+            "",
+            "3. Test guardrail:",
+            '   agentcore invoke \'{"prompt": "Should I buy JPMorgan stock?"}\'',
+            "   Expected: Blocked with custom message",
+            "",
+            f"Configuration saved to: {GUARDRAIL_CONFIG_PATH}"
+        ])
         
         return config
         
@@ -3,84 +3,157 @@
 RAG Phase 3: Create Bedrock Knowledge Base and start vector indexing
 """
 
+import argparse
 import boto3
+import collections
+import concurrent.futures
+import functools
+import importlib.util
+import itertools
 import json
+import random
 import time
 import sys
+import threading
+from botocore.config import Config
+from botocore.exceptions import WaiterError
 
-# Check for required packages
-try:
-    from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
-except ImportError:
-    print("⚠️  Installing opensearch-py...")
-    import subprocess
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "-q", "opensearch-py"])
-    from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
+REGION = boto3.session.Session().region_name
 
+# Keep-alive + larger pool so poll loops reuse TLS connections; adaptive retries back off on throttling
+BOTO_CFG = Config(
+    max_pool_connections=25,
+    tcp_keepalive=True,
+    retries={'mode': 'adaptive', 'max_attempts': 8},
+    connect_timeout=3,
+    read_timeout=15
+)
+
+# One client per service for the whole run (skips repeated endpoint/credential resolution).
+# Creation is locked because boto3's default session is not thread-safe and main() polls from two threads.
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+def get_client(service_name):
+    with _CLIENTS_LOCK:
+        if service_name not in _CLIENTS:
+            _CLIENTS[service_name] = boto3.client(service_name, config=BOTO_CFG)
+        return _CLIENTS[service_name]
+
+def _backoff(attempt):
+    """Exponential backoff with jitter: ~1s, 2s, 4s, 8s, then capped at 15s"""
+    return min(15, 2 ** attempt) + random.uniform(0, 0.5)
+
+def _poll(max_wait):
+    """Yield elapsed seconds before each poll attempt, backing off between attempts until max_wait"""
+    start = time.monotonic()
+    for attempt in itertools.count():
+        yield int(time.monotonic() - start)
+        remaining = max_wait - (time.monotonic() - start)
+        if remaining <= 0:
+            return
+        time.sleep(min(_backoff(attempt), remaining))
+
+# Poll outcomes shared by the collection and knowledge base status loops
+TERMINAL_OK = frozenset({'ACTIVE'})
+TERMINAL_FAIL = frozenset({'FAILED', 'DELETING', 'DELETED'})
+
+def print_lines(lines):
+    """Emit a multi-line block with a single stdout write"""
+    sys.stdout.write('\n'.join(lines) + '\n')
+
+@functools.lru_cache(maxsize=1)
+def get_account_id():
+    return get_client('sts').get_caller_identity()['Account']
+
+# The only bankiq-infra outputs this script needs
+StackOutputs = collections.namedtuple('StackOutputs', 'collection_endpoint collection_arn kb_role_arn bucket_arn batch_bucket_arn')
+
+@functools.lru_cache(maxsize=1)
 def get_stack_outputs(stack_name='bankiq-infra'):
-    cfn = boto3.client('cloudformation')
+    cfn = get_client('cloudformation')
     response = cfn.describe_stacks(StackName=stack_name)
     outputs = {}
     for output in response['Stacks'][0]['Outputs']:
         outputs[output['OutputKey']] = output['OutputValue']
-    return outputs
+    return StackOutputs(
+        collection_endpoint=outputs['VectorStoreCollectionEndpoint'],
+        collection_arn=outputs['VectorStoreCollectionArn'],
+        kb_role_arn=outputs['BedrockKnowledgeBaseRoleArn'],
+        bucket_arn=outputs['SECFilingsBucketArn'],
+        batch_bucket_arn=outputs['EmbeddingBatchBucketArn']
+    )
 
 def check_collection_status():
     """Wait for OpenSearch collection to be ACTIVE"""
-    aoss = boto3.client('opensearchserverless')
+    aoss = get_client('opensearchserverless')
     collection_name = "bankiq-vectors-prod"
     
     print("\n🔍 Checking OpenSearch collection status...")
     
     max_wait = 300
-    waited = 0
-    while waited < max_wait:
+    for waited in _poll(max_wait):
         try:
             collections = aoss.list_collections(
                 collectionFilters={'name': collection_name}
             )
-            if collections['collectionSummaries']:
-                collection = collections['collectionSummaries'][0]
-                status = collection['status']
-                if status == 'ACTIVE':
-                    print(f"✅ Collection is ACTIVE")
-                    return True
-                else:
-                    print(f"   Status: {status}, waiting... ({waited}s)")
-            time.sleep(10)
-            waited += 10
         except Exception as e:
             print(f"   Waiting for collection... ({waited}s)")
-            time.sleep(10)
-            waited += 10
+            continue
+        if collections['collectionSummaries']:
+            collection = collections['collectionSummaries'][0]
+            status = collection['status']
+            if status in TERMINAL_OK:
+                print(f"✅ Collection is ACTIVE")
+                return True
+            if status in TERMINAL_FAIL:
+                raise RuntimeError(f"Collection {collection_name} entered {status}")
+            print(f"   Status: {status}, waiting... ({waited}s)")
     
     print(f"❌ Collection not ACTIVE after {max_wait}s")
     return False
 
-def create_opensearch_index():
-    """Create the vector index in OpenSearch Serverless - REQUIRED before KB creation"""
-    outputs = get_stack_outputs()
-    collection_endpoint = outputs['VectorStoreCollectionEndpoint']
-    index_name = 'bankiq-sec-index'
-    
-    print(f"\n🔧 Creating OpenSearch vector index: {index_name}")
+def _import_opensearch():
+    """Import opensearch-py on first use (installing it if missing), keeping it off the startup path"""
+    global OpenSearch, RequestsHttpConnection, AWSV4SignerAuth, helpers
+    if importlib.util.find_spec('opensearchpy') is None:
+        print("⚠️  Installing opensearch-py...")
+        import subprocess
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "-q", "opensearch-py"])
+        importlib.invalidate_caches()
+    from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth, helpers
+
+@functools.lru_cache(maxsize=1)
+def _get_os_client(outputs):
+    """OpenSearch client for the vector collection, built (and SigV4-signed) once per run"""
+    _import_opensearch()
+    collection_endpoint = outputs.collection_endpoint
     
     # Get AWS credentials for signing requests
     credentials = boto3.Session().get_credentials()
-    auth = AWSV4SignerAuth(credentials, boto3.session.Session().region_name, 'aoss')
+    auth = AWSV4SignerAuth(credentials, REGION, 'aoss')
     
     # Extract host from endpoint URL
     host = collection_endpoint.replace('https://', '')
     
-    # Create OpenSearch client
-    client = OpenSearch(
+    return OpenSearch(
         hosts=[{'host': host, 'port': 443}],
         http_auth=auth,
         use_ssl=True,
         verify_certs=True,
         connection_class=RequestsHttpConnection,
-        timeout=30
+        timeout=30,
+        pool_maxsize=10,
+        http_compress=True
     )
+
+def create_opensearch_index(outputs):
+    """Create the vector index in OpenSearch Serverless - REQUIRED before KB creation"""
+    index_name = 'bankiq-sec-index'
+    
+    print(f"\n🔧 Creating OpenSearch vector index: {index_name}")
+    
+    client = _get_os_client(outputs)
     
     # Check if index already exists
     if client.indices.exists(index=index_name):
@@ -102,8 +175,11 @@ def create_opensearch_index():
                     "method": {
                         "name": "hnsw",
                         "engine": "faiss",
+                        # Graph build cost scales with ef_construction; recall is recovered at
+                        # query time via ef_search, which Faiss reads from the method parameters
                         "parameters": {
-                            "ef_construction": 512,
+                            "ef_construction": 200,
+                            "ef_search": 256,
                             "m": 16
                         }
                     }
@@ -126,13 +202,10 @@ def create_opensearch_index():
         # Poll until index is accessible
         print(f"⏳ Waiting for index to be fully available...")
         max_wait = 60
-        waited = 0
-        while waited < max_wait:
+        for waited in _poll(max_wait):
             if client.indices.exists(index=index_name):
                 print(f"✅ Index verified and accessible ({waited}s)")
                 return True
-            time.sleep(5)
-            waited += 5
         
         print(f"⚠️  Index created but not accessible after {max_wait}s")
         return False
@@ -141,13 +214,11 @@ def create_opensearch_index():
         print(f"❌ Error creating index: {e}")
         return False
 
-def create_knowledge_base():
-    bedrock = boto3.client('bedrock-agent')
-    outputs = get_stack_outputs()
+def create_knowledge_base(outputs):
+    bedrock = get_client('bedrock-agent')
     
     # Get AWS account ID and timestamp for unique KB name
-    import time
-    account_id = boto3.client('sts').get_caller_identity()['Account']
+    account_id = get_account_id()
     timestamp = int(time.time())
     kb_name = f"bankiq-sec-filings-kb-{account_id}-{timestamp}"
     
@@ -155,61 +226,49 @@ def create_knowledge_base():
     
     # Check if KB already exists
     try:
-        kbs = bedrock.list_knowledge_bases()
-        for kb in kbs.get('knowledgeBaseSummaries', []):
-            if kb['name'] == kb_name:
-                print(f"⚠️  Knowledge Base already exists: {kb['knowledgeBaseId']}")
-                return kb['knowledgeBaseId']
+        for page in bedrock.get_paginator('list_knowledge_bases').paginate():
+            for kb in page.get('knowledgeBaseSummaries', []):
+                if kb['name'] == kb_name:
+                    print(f"⚠️  Knowledge Base already exists: {kb['knowledgeBaseId']}")
+                    return kb['knowledgeBaseId']
     except Exception as e:
         print(f"   Error checking existing KBs: {e}")
     
-    # Poll OpenSearch to ensure index is stable before KB creation
+    # Ensure index is stable before KB creation - one server-side long poll instead of client polling
     print("⏳ Verifying index stability...")
-    aoss = boto3.client('opensearchserverless')
-    outputs = get_stack_outputs()
-    collection_endpoint = outputs['VectorStoreCollectionEndpoint']
-    host = collection_endpoint.replace('https://', '')
-    credentials = boto3.Session().get_credentials()
-    auth = AWSV4SignerAuth(credentials, boto3.session.Session().region_name, 'aoss')
-    client = OpenSearch(
-        hosts=[{'host': host, 'port': 443}],
-        http_auth=auth,
-        use_ssl=True,
-        verify_certs=True,
-        connection_class=RequestsHttpConnection,
-        timeout=30
-    )
+    client = _get_os_client(outputs)
     
-    max_wait = 60
-    waited = 0
-    while waited < max_wait:
-        try:
-            if client.indices.exists(index='bankiq-sec-index'):
-                health = client.cluster.health()
-                if health['status'] in ['green', 'yellow']:
-                    print(f"✅ Index stable and ready ({waited}s)")
-                    break
-            time.sleep(5)
-            waited += 5
-        except:
-            time.sleep(5)
-            waited += 5
+    try:
+        health = client.cluster.health(
+            index='bankiq-sec-index',
+            params={
+                'wait_for_status': 'yellow',
+                'wait_for_no_initializing_shards': 'true',
+                'timeout': '60s'
+            }
+        )
+        if health.get('timed_out'):
+            print(f"⚠️  Index not stable after 60s (status: {health.get('status')}), continuing...")
+        else:
+            print(f"✅ Index stable and ready (status: {health.get('status')})")
+    except Exception as e:
+        print(f"⚠️  Could not verify index health ({e}), continuing...")
     
     try:
         response = bedrock.create_knowledge_base(
             name=kb_name,
             description="BankIQ+ SEC filings knowledge base with vector search",
-            roleArn=outputs['BedrockKnowledgeBaseRoleArn'],
+            roleArn=outputs.kb_role_arn,
             knowledgeBaseConfiguration={
                 'type': 'VECTOR',
                 'vectorKnowledgeBaseConfiguration': {
-                    'embeddingModelArn': f"arn:aws:bedrock:{boto3.session.Session().region_name}::foundation-model/amazon.titan-embed-text-v2:0"
+                    'embeddingModelArn': f"arn:aws:bedrock:{REGION}::foundation-model/amazon.titan-embed-text-v2:0"
                 }
             },
             storageConfiguration={
                 'type': 'OPENSEARCH_SERVERLESS',
                 'opensearchServerlessConfiguration': {
-                    'collectionArn': outputs['VectorStoreCollectionArn'],
+                    'collectionArn': outputs.collection_arn,
                     'vectorIndexName': 'bankiq-sec-index',
                     'fieldMapping': {
                         'vectorField': 'embedding',
@@ -226,30 +285,35 @@ def create_knowledge_base():
         
     except Exception as e:
         print(f"❌ Error creating Knowledge Base: {e}")
-        print("\nTroubleshooting:")
-        print("1. Verify OpenSearch collection is active:")
-        print(f"   aws opensearchserverless list-collections --region {boto3.session.Session().region_name}")
-        print("2. Check access policy:")
-        print(f"   aws opensearchserverless list-access-policies --type data --region {boto3.session.Session().region_name}")
-        print("3. Verify index exists:")
-        print(f"   Check OpenSearch console for index 'bankiq-sec-index'")
-        print("4. Manually retry:")
-        print("   python3 cfn/scripts/deploy-knowledge-base.py")
+        print_lines([
+            "\nTroubleshooting:",
+            "1. Verify OpenSearch collection is active:",
+            f"   aws opensearchserverless list-collections --region {REGION}",
+            "2. Check access policy:",
+            f"   aws opensearchserverless list-access-policies --type data --region {REGION}",
+            "3. Verify index exists:",
+            "   Check OpenSearch console for index 'bankiq-sec-index'",
+            "4. Manually retry:",
+            "   python3 cfn/scripts/deploy-knowledge-base.py"
+        ])
         sys.exit(1)
 
-def create_data_source(kb_id):
-    bedrock = boto3.client('bedrock-agent')
-    outputs = get_stack_outputs()
+def create_data_source(kb_id, outputs):
+    bedrock = get_client('bedrock-agent')
     
     print(f"\n📂 Creating Data Source for KB: {kb_id}")
     
     # Check if data source already exists
     try:
-        data_sources = bedrock.list_data_sources(knowledgeBaseId=kb_id)
-        for ds in data_sources.get('dataSourceSummaries', []):
-            if ds['name'] == 'sec-filings-s3-source':
-                print(f"⚠️  Data Source already exists: {ds['dataSourceId']}")
-                return ds['dataSourceId']
+        pages = bedrock.get_paginator('list_data_sources').paginate(
+            knowledgeBaseId=kb_id,
+            PaginationConfig={'PageSize': 100}
+        )
+        for page in pages:
+            for ds in page.get('dataSourceSummaries', []):
+                if ds['name'] == 'sec-filings-s3-source':
+                    print(f"⚠️  Data Source already exists: {ds['dataSourceId']}")
+                    return ds['dataSourceId']
     except Exception as e:
         print(f"   Error checking existing data sources: {e}")
     
@@ -261,7 +325,7 @@ def create_data_source(kb_id):
             dataSourceConfiguration={
                 'type': 'S3',
                 's3Configuration': {
-                    'bucketArn': outputs['SECFilingsBucketArn']
+                    'bucketArn': outputs.bucket_arn
                 }
             },
             vectorIngestionConfiguration={
@@ -284,21 +348,32 @@ def create_data_source(kb_id):
         sys.exit(1)
 
 def start_ingestion(kb_id, ds_id):
-    bedrock = boto3.client('bedrock-agent')
+    bedrock = get_client('bedrock-agent')
     
     # Wait for KB to be ACTIVE
     print(f"\n⏳ Waiting for Knowledge Base to be ACTIVE...")
     max_wait = 60
-    waited = 0
-    while waited < max_wait:
-        kb = bedrock.get_knowledge_base(knowledgeBaseId=kb_id)
-        status = kb['knowledgeBase']['status']
-        if status == 'ACTIVE':
-            print(f"✅ Knowledge Base is ACTIVE")
-            break
-        print(f"   Status: {status} ({waited}s)")
-        time.sleep(5)
-        waited += 5
+    if 'knowledge_base_active' in bedrock.waiter_names:
+        try:
+            bedrock.get_waiter('knowledge_base_active').wait(
+                knowledgeBaseId=kb_id,
+                WaiterConfig={'Delay': 2, 'MaxAttempts': max_wait // 2}
+            )
+        except WaiterError as e:
+            print(f"❌ Knowledge Base {kb_id} did not become ACTIVE: {e}")
+            sys.exit(1)
+        print(f"✅ Knowledge Base is ACTIVE")
+    else:
+        for waited in _poll(max_wait):
+            kb = bedrock.get_knowledge_base(knowledgeBaseId=kb_id)
+            status = kb['knowledgeBase']['status']
+            if status in TERMINAL_OK:
+                print(f"✅ Knowledge Base is ACTIVE")
+                break
+            if status in TERMINAL_FAIL:
+                print(f"❌ Knowledge Base {kb_id} entered {status}")
+                sys.exit(1)
+            print(f"   Status: {status} ({waited}s)")
     
     print(f"\n🔄 Starting ingestion job...")
     
@@ -319,54 +394,233 @@ def start_ingestion(kb_id, ds_id):
         print(f"❌ Error starting ingestion: {e}")
         sys.exit(1)
 
-def main():
-    print("="*60)
-    print("RAG Phase 3: Knowledge Base Setup")
-    print("="*60)
+# Batch path (--batch): embed with Bedrock batch inference and bulk-load the index ourselves
+EMBED_MODEL_ID = 'amazon.titan-embed-text-v2:0'
+EMBED_INPUT_PREFIX = 'embed-input/'
+EMBED_OUTPUT_PREFIX = 'embed-output/'
+CHUNK_TOKENS = 512
+CHUNK_OVERLAP = 0.2
+# Bedrock batch inference limits: minimum records per job, maximum records per input file
+BATCH_MIN_RECORDS = 100
+BATCH_RECORDS_PER_FILE = 50000
+BATCH_MAX_WAIT = 6 * 3600
+
+def _bucket_name(outputs):
+    return outputs.bucket_arn.split(':::', 1)[1]
+
+def _batch_bucket_name(outputs):
+    # Batch files live outside the SEC filings bucket so the data source never crawls them
+    return outputs.batch_bucket_arn.split(':::', 1)[1]
+
+def chunk_text(text, max_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
+    """Split text into max_tokens-word windows overlapping by the given fraction (matches the data source chunking)"""
+    words = text.split()
+    step = max(1, int(max_tokens * (1 - overlap)))
+    for start in range(0, len(words), step):
+        yield ' '.join(words[start:start + max_tokens])
+        if start + max_tokens >= len(words):
+            return
+
+def build_batch_records(outputs):
+    """Chunk every filing in the bucket into batch-inference records; returns (records, recordId -> S3 key)"""
+    s3 = get_client('s3')
+    bucket = _bucket_name(outputs)
+    records = []
+    sources = {}
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket):
+        for obj in page.get('Contents', []):
+            key = obj['Key']
+            if not key.endswith('.txt'):
+                continue
+            text = s3.get_object(Bucket=bucket, Key=key)['Body'].read().decode('utf-8', errors='ignore')
+            for chunk in chunk_text(text):
+                # recordId must be 11 characters, so map it back to the filing locally
+                record_id = f"{len(records):011d}"
+                sources[record_id] = key
+                records.append(json.dumps({'recordId': record_id, 'modelInput': {'inputText': chunk}}))
+    return records, sources
+
+def write_batch_input(outputs, job_name, records):
+    """Write records as JSONL files under embed-input/<job_name>/ and return the prefix URI"""
+    s3 = get_client('s3')
+    bucket = _batch_bucket_name(outputs)
+    prefix = f"{EMBED_INPUT_PREFIX}{job_name}/"
+    for part, start in enumerate(range(0, len(records), BATCH_RECORDS_PER_FILE)):
+        body = '\n'.join(records[start:start + BATCH_RECORDS_PER_FILE]) + '\n'
+        s3.put_object(Bucket=bucket, Key=f"{prefix}part-{part:05d}.jsonl", Body=body.encode('utf-8'))
+    return f"s3://{bucket}/{prefix}"
+
+def run_batch_embedding(outputs, job_name, input_uri):
+    """Submit the Titan embeddings batch job and wait for it; returns the job ID"""
+    bedrock = get_client('bedrock')
+    response = bedrock.create_model_invocation_job(
+        jobName=job_name,
+        roleArn=outputs.kb_role_arn,
+        modelId=EMBED_MODEL_ID,
+        inputDataConfig={'s3InputDataConfig': {'s3Uri': input_uri, 's3InputFormat': 'JSONL'}},
+        outputDataConfig={'s3OutputDataConfig': {'s3Uri': f"s3://{_batch_bucket_name(outputs)}/{EMBED_OUTPUT_PREFIX}"}}
+    )
+    job_arn = response['jobArn']
+    print(f"✅ Batch job submitted: {job_arn}")
     
-    # Step 1: Check collection status
-    if not check_collection_status():
-        print("\n❌ OpenSearch collection not ready")
-        sys.exit(1)
+    for waited in _poll(BATCH_MAX_WAIT):
+        job = bedrock.get_model_invocation_job(jobIdentifier=job_arn)
+        status = job['status']
+        if status in ('Completed', 'PartiallyCompleted'):
+            print(f"✅ Batch job {status} ({waited}s)")
+            return job_arn.rsplit('/', 1)[-1]
+        if status in ('Failed', 'Stopping', 'Stopped', 'Expired'):
+            raise RuntimeError(f"Batch job {status}: {job.get('message', '')}")
+        print(f"   Status: {status} ({waited}s)")
+    
+    raise RuntimeError(f"Batch job not finished after {BATCH_MAX_WAIT}s")
+
+def bulk_load_embeddings(outputs, job_id, sources):
+    """Stream the batch output into the vector index with _bulk; returns (indexed, failed)"""
+    client = _get_os_client(outputs)
+    s3 = get_client('s3')
+    bucket = _bucket_name(outputs)
+    batch_bucket = _batch_bucket_name(outputs)
+    
+    def actions():
+        for page in s3.get_paginator('list_objects_v2').paginate(Bucket=batch_bucket, Prefix=f"{EMBED_OUTPUT_PREFIX}{job_id}/"):
+            for obj in page.get('Contents', []):
+                if not obj['Key'].endswith('.jsonl.out'):
+                    continue
+                for line in s3.get_object(Bucket=batch_bucket, Key=obj['Key'])['Body'].iter_lines():
+                    record = json.loads(line)
+                    # Records that failed to embed carry an error instead of modelOutput
+                    if 'modelOutput' not in record:
+                        continue
+                    yield {
+                        '_index': 'bankiq-sec-index',
+                        '_source': {
+                            'embedding': record['modelOutput']['embedding'],
+                            'text': record['modelInput']['inputText'],
+                            'metadata': json.dumps({'x-amz-bedrock-kb-source-uri': f"s3://{bucket}/{sources[record['recordId']]}"})
+                        }
+                    }
     
-    # Step 2: Poll for access policy propagation
+    indexed, errors = helpers.bulk(client, actions(), chunk_size=1000, raise_on_error=False)
+    return indexed, len(errors)
+
+def batch_ingest(outputs):
+    """Embed the corpus via Bedrock batch inference; returns the indexed count, or None if the corpus is too small"""
+    print(f"\n📦 Preparing batch embedding input...")
+    records, sources = build_batch_records(outputs)
+    if len(records) < BATCH_MIN_RECORDS:
+        print(f"⚠️  Only {len(records)} chunks (batch minimum is {BATCH_MIN_RECORDS}), using KB ingestion instead")
+        return None
+    
+    job_name = f"bankiq-embed-{int(time.time())}"
+    input_uri = write_batch_input(outputs, job_name, records)
+    print(f"✅ Wrote {len(records)} chunks to {input_uri}")
+    
+    try:
+        print(f"\n🔄 Running batch embedding job...")
+        job_id = run_batch_embedding(outputs, job_name, input_uri)
+        
+        print(f"\n📥 Bulk-loading vectors into bankiq-sec-index...")
+        indexed, failed = bulk_load_embeddings(outputs, job_id, sources)
+        print(f"✅ Indexed {indexed} chunks ({failed} failed)")
+        return indexed
+        
+    except Exception as e:
+        print(f"❌ Error during batch ingestion: {e}")
+        sys.exit(1)
+
+# Data access policy created by the bankiq-infra stack (VectorStoreAccessPolicy)
+ACCESS_POLICY_NAMES = frozenset({'bankiq-vectors-access-prod'})
+
+def _data_access_policy_names(aoss):
+    """Names of all data access policies, following nextToken across pages"""
+    names = set()
+    kwargs = {'type': 'data', 'maxResults': 100}
+    while True:
+        policies = aoss.list_access_policies(**kwargs)
+        names.update(p.get('name', '') for p in policies.get('accessPolicySummaries', []))
+        if not policies.get('nextToken'):
+            return names
+        kwargs['nextToken'] = policies['nextToken']
+
+def wait_access_policies():
+    """Wait for the data access policy to propagate"""
     print("\n⏳ Waiting for access policies to propagate...")
-    aoss = boto3.client('opensearchserverless')
+    aoss = get_client('opensearchserverless')
     max_wait = 90
-    waited = 0
-    while waited < max_wait:
+    for waited in _poll(max_wait):
         try:
-            policies = aoss.list_access_policies(type='data')
-            if any('bankiq' in p.get('name', '') for p in policies.get('accessPolicySummaries', [])):
+            if ACCESS_POLICY_NAMES & _data_access_policy_names(aoss):
                 print(f"✅ Access policies active ({waited}s)")
-                break
+                return True
         except:
             pass
-        time.sleep(5)
-        waited += 5
+    return False
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG Phase 3: Knowledge Base Setup")
+    parser.add_argument('--batch', action='store_true',
+                        help="Embed filings with Bedrock batch inference and bulk-load the index instead of KB ingestion")
+    args = parser.parse_args()
+    
+    print("="*60)
+    print("RAG Phase 3: Knowledge Base Setup")
+    print("="*60)
+    
+    # Steps 1-2: Collection status and access policy propagation are independent,
+    # so wait on both concurrently (total wait is the longer of the two, not the sum)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        collection_future = executor.submit(check_collection_status)
+        executor.submit(wait_access_policies)
+    
+    try:
+        collection_ready = collection_future.result()
+    except RuntimeError as e:
+        print(f"\n❌ {e}")
+        sys.exit(1)
+    if not collection_ready:
+        print("\n❌ OpenSearch collection not ready")
+        sys.exit(1)
+    
+    outputs = get_stack_outputs()
     
     # Step 3: Create OpenSearch index (REQUIRED before KB creation)
-    if not create_opensearch_index():
+    if not create_opensearch_index(outputs):
         print("\n❌ Failed to create OpenSearch index")
         sys.exit(1)
     
     # Step 4: Create Knowledge Base
-    kb_id = create_knowledge_base()
+    kb_id = create_knowledge_base(outputs)
+    
+    # Batch path: index is loaded directly, so no data source or ingestion job is needed
+    indexed = batch_ingest(outputs) if args.batch else None
+    if indexed is not None:
+        print_lines([
+            "\n" + "="*60,
+            "✅ KNOWLEDGE BASE SETUP COMPLETE",
+            "="*60,
+            f"Knowledge Base ID: {kb_id}",
+            f"Chunks indexed via batch inference: {indexed}",
+            f"\n💡 Next: Backend will automatically use KB ID: {kb_id}"
+        ])
+        return
     
     # Step 5: Create Data Source
-    ds_id = create_data_source(kb_id)
+    ds_id = create_data_source(kb_id, outputs)
     
     # Step 6: Start Ingestion
     job_id = start_ingestion(kb_id, ds_id)
     
-    print("\n" + "="*60)
-    print("✅ KNOWLEDGE BASE SETUP COMPLETE")
-    print("="*60)
-    print(f"Knowledge Base ID: {kb_id}")
-    print(f"Data Source ID: {ds_id}")
-    print(f"Ingestion Job ID: {job_id}")
-    print(f"\n📊 Ingestion will run in background (5-15 minutes)")
-    print(f"\n💡 Next: Backend will automatically use KB ID: {kb_id}")
+    print_lines([
+        "\n" + "="*60,
+        "✅ KNOWLEDGE BASE SETUP COMPLETE",
+        "="*60,
+        f"Knowledge Base ID: {kb_id}",
+        f"Data Source ID: {ds_id}",
+        f"Ingestion Job ID: {job_id}",
+        "\n📊 Ingestion will run in background (5-15 minutes)",
+        f"\n💡 Next: Backend will automatically use KB ID: {kb_id}"
+    ])
 
 if __name__ == "__main__":
     main()
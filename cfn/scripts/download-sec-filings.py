@@ -4,14 +4,25 @@ Download SEC 10-K and 10-Q filings for top 10 banks (Oct 2024 - Oct 2025)
 Downloads CLEAN TEXT ONLY - optimized for Bedrock Knowledge Base ingestion
 """
 
+import functools
+import gzip
+import html
+import io
+import multiprocessing
 import os
 import sys
+import tempfile
+import threading
 import time
 import requests
 import boto3
 import re
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 # Install dependencies if needed
 try:
@@ -22,6 +33,17 @@ except ImportError:
     subprocess.check_call([sys.executable, "-m", "pip", "install", "-q", "beautifulsoup4", "lxml"])
     from bs4 import BeautifulSoup
 
+# selectolax wraps the C Lexbor parser and is much faster for HTML -> text; BeautifulSoup is the fallback
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Top 10 banks with their CIK numbers
 BANKS = {
     "JPMORGAN-CHASE": "0000019617",
@@ -41,29 +63,120 @@ HEADERS = {
     "Accept-Encoding": "gzip, deflate"
 }
 
+# One pooled keep-alive session for all SEC requests; retries transient errors with backoff
+# (raise_on_status=False hands the final response back so callers still see the status code)
+_SESSION = requests.Session()
+_SESSION.headers.update(HEADERS)
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=1.0, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+))
+
+class TokenBucket:
+    """Thread-safe token bucket: callers only block when the request budget is used up"""
+    
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.ts = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+            self.ts = now
+            if self.tokens < 1:
+                time.sleep((1 - self.tokens) / self.rate)
+                self.tokens = 0
+                self.ts = time.monotonic()
+            else:
+                self.tokens -= 1
+
+# SEC fair-access limit is 10 requests/second; stay under it across all threads
+_RATE = TokenBucket(8, 8)
+
+# Caps in-flight SEC requests across all bank and filing workers
+_SEC_SLOTS = threading.BoundedSemaphore(10)
+
+# Large filings go up as concurrent 8MB parts instead of one single-shot PUT
+UPLOAD_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=4,
+    use_threads=True
+)
+
+# HTML parsing holds the GIL, so it runs in worker processes instead of the download threads.
+# Workers are spawned (not forked) because they start while download threads are running.
+_PARSE_POOL = ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context('spawn'))
+
+# Filing dates in the 2024-2025 window; captures the year and month
+_DATE_RE = re.compile(r'^(2024|2025)-(\d{2})-')
+
 # Bedrock KB limits
 MAX_FILE_SIZE = 45 * 1024 * 1024  # 45MB (leave buffer under 50MB limit)
 
+TRUNCATION_NOTE = b"\n\n[Content truncated to fit 50MB limit]"
+
+# Exhibits after the first </DOCUMENT> are never used, so downloads stop there
+DOC_END = b'</DOCUMENT>'
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Raw filings cached across runs (gzip SGML keyed by accession), so reruns skip SEC entirely
+SEC_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'bankiq', 'sec')
+
 def clean_text(text):
     """Clean and normalize text"""
-    # Remove excessive whitespace
-    text = re.sub(r'\n\s*\n\s*\n+', '\n\n', text)
-    # Remove lines with only whitespace
-    lines = [line.rstrip() for line in text.split('\n')]
-    text = '\n'.join(line for line in lines if line)
-    return text.strip()
+    # Strip trailing whitespace and drop lines left empty, in one pass over C-level builtins
+    # (this also removes blank-line runs, so no separate regex pass is needed)
+    return '\n'.join(filter(None, map(str.rstrip, text.split('\n')))).strip()
+
+# Regex fast path: filing HTML is machine-generated and well formed, so stripping tags and
+# trimming each line approximates get_text(separator='\n', strip=True) at a fraction of the cost
+_NON_CONTENT = re.compile(r'<!--.*?-->|<(script|style|noscript|iframe)\b[^>]*>.*?</\1\s*>', re.I | re.S)
+_TAG = re.compile(r'<[^>]+>')
+
+def strip_tags_fast(html_content):
+    """Strip markup with regexes; returns None when the output looks unreliable"""
+    text = _NON_CONTENT.sub('\n', html_content)
+    text = _TAG.sub('\n', text)
+    # A bare '<' must be escaped in valid HTML, so leftovers mean tags the regex missed
+    if text.count('<') > len(text) // 10000:
+        return None
+    # Trim both ends of every line, as strip=True does per text node (drops &nbsp; indentation too)
+    text = '\n'.join(filter(None, map(str.strip, html.unescape(text).split('\n'))))
+    return text if len(text) > 1000 else None
 
 def extract_clean_text_from_html(html_content):
     """Extract clean text from HTML, removing all markup"""
+    text = strip_tags_fast(html_content)
+    if text is not None:
+        return text
+    
+    # Fall back to a real parser for markup the regexes can't handle
     try:
-        soup = BeautifulSoup(html_content, 'lxml')
-        
-        # Remove script, style, and other non-content elements
-        for element in soup(['script', 'style', 'meta', 'link', 'noscript', 'iframe']):
-            element.decompose()
-        
-        # Get text
-        text = soup.get_text(separator='\n', strip=True)
+        if LexborHTMLParser is not None:
+            tree = LexborHTMLParser(html_content)
+            
+            # Remove script, style, and other non-content elements
+            for node in tree.css('script, style, meta, link, noscript, iframe'):
+                node.decompose()
+            
+            # Get text
+            root = tree.body or tree
+            text = root.text(separator='\n', strip=True)
+        else:
+            soup = BeautifulSoup(html_content, 'lxml')
+            
+            # Remove script, style, and other non-content elements
+            for element in soup(['script', 'style', 'meta', 'link', 'noscript', 'iframe']):
+                element.decompose()
+            
+            # Get text
+            text = soup.get_text(separator='\n', strip=True)
         
         # Clean up
         text = clean_text(text)
@@ -73,50 +186,115 @@ def extract_clean_text_from_html(html_content):
         print(f"      Warning: HTML parsing error: {e}")
         return None
 
-def download_filing_clean_text(cik, accession, bank_name, form_type, date):
-    """Download SEC filing and extract CLEAN TEXT ONLY"""
+def truncate_utf8(buf, limit):
+    """Cut encoded text to at most limit bytes without splitting a multi-byte character"""
+    if len(buf) <= limit:
+        return buf
+    cut = limit
+    # buf[cut] is the first dropped byte; if it continues a character, drop that character's lead bytes too
+    while cut > 0 and (buf[cut] & 0xC0) == 0x80:
+        cut -= 1
+    return buf[:cut]
+
+def read_first_document(response):
+    """Read a streamed submission only up to the end of its first document (the main filing)"""
+    buf = bytearray()
+    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+        # Rescan only the tail that could hold a marker split across chunks
+        scan_from = max(0, len(buf) - len(DOC_END) + 1)
+        buf += chunk
+        end = buf.find(DOC_END, scan_from)
+        if end != -1:
+            return bytes(buf[:end + len(DOC_END)])
+    return bytes(buf)
+
+def read_cached_filing(accession):
+    """Return cached raw filing bytes, or None on a miss or unreadable entry"""
+    try:
+        with open(os.path.join(SEC_CACHE_DIR, f"{accession}.txt.gz"), 'rb') as f:
+            return gzip.decompress(f.read())
+    except (OSError, EOFError):
+        return None
+
+def write_cached_filing(accession, raw):
+    """Best-effort cache write; temp file + rename so a crash never leaves a truncated entry"""
+    try:
+        os.makedirs(SEC_CACHE_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile('wb', dir=SEC_CACHE_DIR, delete=False) as tf:
+            tf.write(gzip.compress(raw, compresslevel=6))
+        os.replace(tf.name, os.path.join(SEC_CACHE_DIR, f"{accession}.txt.gz"))
+    except OSError as e:
+        print(f"      Warning: could not cache filing: {e}")
+
+def fetch_filing_bytes(cik, accession):
+    """Download the raw SGML of a filing's main document (network only)"""
+    cached = read_cached_filing(accession)
+    if cached is not None:
+        print(f"      Using cached filing {accession}")
+        return cached
+    
     try:
         accession_no_dash = accession.replace('-', '')
         cik_no_leading = cik.lstrip('0')
         
         # Download the complete submission file
         txt_url = f"https://www.sec.gov/Archives/edgar/data/{cik_no_leading}/{accession_no_dash}/{accession}.txt"
-        response = requests.get(txt_url, headers=HEADERS, timeout=30)
+        _RATE.acquire()
+        with _SEC_SLOTS, _SESSION.get(txt_url, stream=True, timeout=30) as response:
+            if response.status_code != 200:
+                print(f"      Failed to download: HTTP {response.status_code}")
+                return None
+            raw = read_first_document(response)
         
-        if response.status_code != 200:
-            print(f"      Failed to download: HTTP {response.status_code}")
-            return None
+        write_cached_filing(accession, raw)
+        return raw
         
-        content = response.text
+    except Exception as e:
+        print(f"      Error: {e}")
+        return None
+
+def parse_filing_bytes(raw, meta):
+    """Turn raw filing SGML into the UTF-8 clean text uploaded to S3 (pure CPU, runs in a worker process)"""
+    try:
+        bank_name = meta['bank_name']
+        form_type = meta['form_type']
+        date = meta['date']
+        cik = meta['cik']
+        accession = meta['accession']
+        
+        content = None
         
-        # Extract the main document from SGML structure
-        if '<DOCUMENT>' in content:
-            # Find first document (main filing)
-            start = content.find('<DOCUMENT>')
-            end = content.find('</DOCUMENT>', start)
+        # Extract the main document from SGML structure, working on the raw bytes
+        # so only the <TEXT> body gets decoded
+        start = raw.find(b'<DOCUMENT>')
+        # raw ends at the first </DOCUMENT> (see read_first_document), so search for the
+        # closing markers from the end; only the header and tail bytes get scanned
+        end = raw.rfind(DOC_END, start) if start != -1 else -1
+        
+        if start != -1 and end != -1:
+            # Extract TEXT section of the first document (main filing)
+            text_start = raw.find(b'<TEXT>', start, end)
+            text_end = raw.rfind(b'</TEXT>', start, end)
             
-            if start != -1 and end != -1:
-                doc_section = content[start:end]
-                
-                # Extract TEXT section
-                text_start = doc_section.find('<TEXT>')
-                text_end = doc_section.find('</TEXT>')
+            if text_start != -1 and text_end != -1:
+                doc_bytes = raw[text_start + 6:text_end]
+                doc_content = doc_bytes.decode('utf-8', errors='replace')
                 
-                if text_start != -1 and text_end != -1:
-                    doc_content = doc_section[text_start + 6:text_end]
-                    
-                    # Check if it's HTML
-                    if '<html' in doc_content.lower() or '<HTML' in doc_content:
-                        # Extract clean text from HTML
-                        clean_content = extract_clean_text_from_html(doc_content)
-                        if clean_content and len(clean_content) > 1000:
-                            content = clean_content
-                        else:
-                            print(f"      Warning: Extracted text too short")
-                            return None
+                # Check if it's HTML
+                if b'<html' in doc_bytes[:2048].lower():
+                    # Extract clean text from HTML
+                    clean_content = extract_clean_text_from_html(doc_content)
+                    if clean_content and len(clean_content) > 1000:
+                        content = clean_content
                     else:
-                        # Already plain text, just clean it
-                        content = clean_text(doc_content)
+                        print(f"      Warning: Extracted text too short")
+                        return None
+                else:
+                    # Already plain text, just clean it
+                    content = clean_text(doc_content)
+        
+        if content is None:
+            content = raw.decode('utf-8', errors='replace')
         
         # Add metadata header
         header = f"""SEC {form_type} Filing
@@ -129,26 +307,38 @@ Accession: {accession}
 
 """
         
-        full_content = header + content
-        
-        # Check size and truncate if needed
-        content_bytes = full_content.encode('utf-8')
+        # Encode once; the size limit is in bytes, so truncate the bytes
+        content_bytes = (header + content).encode('utf-8')
         if len(content_bytes) > MAX_FILE_SIZE:
             print(f"      Warning: File too large ({len(content_bytes)/1024/1024:.1f}MB), truncating...")
             # Truncate to fit
-            full_content = full_content[:MAX_FILE_SIZE - 1000]  # Leave buffer
-            full_content += "\n\n[Content truncated to fit 50MB limit]"
-            content_bytes = full_content.encode('utf-8')
+            content_bytes = truncate_utf8(content_bytes, MAX_FILE_SIZE - 1024) + TRUNCATION_NOTE  # Leave buffer
         
         size_mb = len(content_bytes) / 1024 / 1024
         print(f"      Extracted {size_mb:.1f}MB of clean text")
         
-        return full_content
+        return content_bytes
         
     except Exception as e:
         print(f"      Error: {e}")
         return None
 
+def download_filing_clean_text(cik, accession, bank_name, form_type, date):
+    """Download SEC filing and extract CLEAN TEXT ONLY"""
+    raw = fetch_filing_bytes(cik, accession)
+    if raw is None:
+        return None
+    
+    meta = {
+        'bank_name': bank_name,
+        'form_type': form_type,
+        'date': date,
+        'cik': cik,
+        'accession': accession
+    }
+    return _PARSE_POOL.submit(parse_filing_bytes, raw, meta).result()
+
+@functools.lru_cache(maxsize=None)
 def get_region():
     """Get AWS region from environment or default"""
     region = os.environ.get('AWS_REGION') or os.environ.get('AWS_DEFAULT_REGION')
@@ -160,13 +350,18 @@ def get_region():
             region = 'us-east-1'
     return region
 
+@functools.lru_cache(maxsize=None)
+def _boto_client(service, region):
+    """One client per service/region for the whole run (boto3 clients are thread-safe)"""
+    return boto3.client(service, region_name=region)
+
 def get_s3_client():
-    region = get_region()
-    return boto3.client('s3', region_name=region)
+    return _boto_client('s3', get_region())
 
+@functools.lru_cache(maxsize=None)
 def get_bucket_name():
     region = get_region()
-    cfn = boto3.client('cloudformation', region_name=region)
+    cfn = _boto_client('cloudformation', region)
     try:
         response = cfn.describe_stacks(StackName='bankiq-infra')
         outputs = response['Stacks'][0]['Outputs']
@@ -174,101 +369,132 @@ def get_bucket_name():
             if output['OutputKey'] == 'SECFilingsBucketName':
                 return output['OutputValue']
     except:
-        region = get_region()
-        account_id = boto3.client('sts', region_name=region).get_caller_identity()['Account']
+        account_id = _boto_client('sts', region).get_caller_identity()['Account']
         return f"bankiq-sec-filings-{account_id}-prod"
 
+def already_uploaded(s3, bucket, key, accession, size):
+    """True when the object at key already holds this accession's text (same accession metadata and size)"""
+    try:
+        head = s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] != '404':
+            raise
+        return False
+    return head['Metadata'].get('accession') == accession and head['ContentLength'] == size
+
+def upload_filing(s3, bucket_name, bank_name, cik, form, date, accession, quarter, step):
+    """Download one filing and upload its clean text to S3; returns True on success"""
+    if form == '10-K':
+        s3_key = f"{bank_name}/10-K/{date[:4]}.txt"
+        label = f"10-K {date[:4]}"
+        form_type = '10-K'
+        metadata = {
+            'bank': bank_name,
+            'form_type': '10-K',
+            'filing_date': date,
+            'accession': accession
+        }
+    else:
+        s3_key = f"{bank_name}/10-Q/{date[:4]}-Q{quarter}.txt"
+        label = f"10-Q {date[:4]}-Q{quarter}"
+        form_type = f'10-Q Q{quarter}'
+        metadata = {
+            'bank': bank_name,
+            'form_type': '10-Q',
+            'filing_date': date,
+            'quarter': f'Q{quarter}',
+            'accession': accession
+        }
+    
+    print(f"  [{step}/4] Downloading {label}...")
+    content = download_filing_clean_text(cik, accession, bank_name, form_type, date)
+    
+    if not content:
+        print(f"      Skipping - download failed")
+        return False
+    
+    # Skip the PUT on reruns when S3 already has this exact filing
+    if already_uploaded(s3, bucket_name, s3_key, accession, len(content)):
+        print(f"      ✓ Already in s3://{bucket_name}/{s3_key}")
+        return True
+    
+    # Upload to S3
+    s3.upload_fileobj(
+        io.BytesIO(content),
+        bucket_name,
+        s3_key,
+        ExtraArgs={'ContentType': 'text/plain', 'Metadata': metadata},
+        Config=UPLOAD_CONFIG
+    )
+    
+    print(f"      ✓ Uploaded to s3://{bucket_name}/{s3_key}")
+    return True
+
+def fill_slot(candidates, lock, s3, bucket_name, bank_name, cik, step):
+    """Upload the newest remaining candidate that succeeds, moving on to older ones on failure"""
+    while True:
+        with lock:
+            filing = next(candidates, None)
+        if filing is None:
+            return False
+        try:
+            if upload_filing(s3, bucket_name, bank_name, cik, *filing, step):
+                return True
+        except Exception as e:
+            print(f"      ❌ Upload failed: {e}")
+
 def download_bank_filings(bank_name, cik, bucket_name):
     print(f"\n{'='*60}")
     print(f"Processing {bank_name} (CIK: {cik})")
     print(f"{'='*60}")
     
     s3 = get_s3_client()
-    downloaded = 0
     
     # Get recent filings from SEC EDGAR
     try:
         url = f"https://data.sec.gov/submissions/CIK{cik}.json"
-        response = requests.get(url, headers=HEADERS, timeout=30)
+        _RATE.acquire()
+        with _SEC_SLOTS:
+            response = _SESSION.get(url, timeout=30)
         response.raise_for_status()
         
-        data = response.json()
+        # Submissions JSON runs to hundreds of KB; orjson parses it several times faster
+        data = orjson.loads(response.content) if orjson else response.json()
         filings = data.get('filings', {}).get('recent', {})
         
         forms = filings.get('form', [])
         dates = filings.get('filingDate', [])
         accessions = filings.get('accessionNumber', [])
         
-        # Find 1 10-K and 3 10-Qs from 2024-2025
-        tenk_found = 0
-        tenq_found = 0
+        # Candidate 10-Ks and 10-Qs from 2024-2025, newest first (EDGAR lists recent filings newest first)
+        tenk_candidates = []
+        tenq_candidates = []
         
-        for i, (form, date, accession) in enumerate(zip(forms, dates, accessions)):
-            if not (date.startswith('2024') or date.startswith('2025')):
+        for form, date, accession in zip(forms, dates, accessions):
+            if date < '2024':
+                break
+            match = _DATE_RE.match(date)
+            if not match:
                 continue
+            quarter = ((int(match.group(2)) - 1) // 3) + 1
             
-            if form == '10-K' and tenk_found < 1:
-                s3_key = f"{bank_name}/10-K/{date[:4]}.txt"
-                
-                print(f"  [1/4] Downloading 10-K {date[:4]}...")
-                content = download_filing_clean_text(cik, accession, bank_name, '10-K', date)
-                
-                if not content:
-                    print(f"      Skipping - download failed")
-                    continue
-                
-                # Upload to S3
-                s3.put_object(
-                    Bucket=bucket_name,
-                    Key=s3_key,
-                    Body=content.encode('utf-8'),
-                    ContentType='text/plain',
-                    Metadata={
-                        'bank': bank_name,
-                        'form_type': '10-K',
-                        'filing_date': date,
-                        'accession': accession
-                    }
-                )
-                
-                print(f"      ✓ Uploaded to s3://{bucket_name}/{s3_key}")
-                tenk_found += 1
-                downloaded += 1
-                time.sleep(0.5)
-                
-            elif form == '10-Q' and tenq_found < 3:
-                quarter = ((int(date[5:7]) - 1) // 3) + 1
-                s3_key = f"{bank_name}/10-Q/{date[:4]}-Q{quarter}.txt"
-                
-                print(f"  [{tenq_found+2}/4] Downloading 10-Q {date[:4]}-Q{quarter}...")
-                content = download_filing_clean_text(cik, accession, bank_name, f'10-Q Q{quarter}', date)
-                
-                if not content:
-                    print(f"      Skipping - download failed")
-                    continue
-                
-                # Upload to S3
-                s3.put_object(
-                    Bucket=bucket_name,
-                    Key=s3_key,
-                    Body=content.encode('utf-8'),
-                    ContentType='text/plain',
-                    Metadata={
-                        'bank': bank_name,
-                        'form_type': '10-Q',
-                        'filing_date': date,
-                        'quarter': f'Q{quarter}',
-                        'accession': accession
-                    }
-                )
-                
-                print(f"      ✓ Uploaded to s3://{bucket_name}/{s3_key}")
-                tenq_found += 1
-                downloaded += 1
-                time.sleep(0.5)
-            
-            if tenk_found >= 1 and tenq_found >= 3:
-                break
+            if form == '10-K':
+                tenk_candidates.append((form, date, accession, quarter))
+            elif form == '10-Q':
+                tenq_candidates.append((form, date, accession, quarter))
+        
+        # Fill 1 10-K slot and 3 10-Q slots concurrently; each slot falls back to the next
+        # older candidate of its form when a download or upload fails
+        lock = threading.Lock()
+        tenk_iter = iter(tenk_candidates)
+        tenq_iter = iter(tenq_candidates)
+        slots = [(tenk_iter, 1), (tenq_iter, 2), (tenq_iter, 3), (tenq_iter, 4)]
+        with ThreadPoolExecutor(max_workers=len(slots)) as executor:
+            futures = [
+                executor.submit(fill_slot, candidates, lock, s3, bucket_name, bank_name, cik, step)
+                for candidates, step in slots
+            ]
+            downloaded = sum(future.result() for future in futures)
         
         if downloaded < 4:
             print(f"  ⚠️  Only found {downloaded}/4 filings for {bank_name}")
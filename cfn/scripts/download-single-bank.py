@@ -4,78 +4,247 @@ Download SEC filings for a single bank
 Usage: python3 download-single-bank.py <BANK-FOLDER-NAME> <CIK> <S3-BUCKET>
 """
 
+import functools
+import gzip
+import html
+import io
 import sys
 import os
+import tempfile
+import threading
 import time
 import requests
 import boto3
 import re
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 
+# selectolax wraps the C Lexbor parser and is much faster for HTML -> text; BeautifulSoup is the fallback
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 HEADERS = {
     "User-Agent": "BankIQ+ bankiq@example.com",
     "Accept-Encoding": "gzip, deflate"
 }
 
+# One pooled keep-alive session for all SEC requests; retries transient errors with backoff
+# (raise_on_status=False hands the final response back so callers still see the status code)
+_SESSION = requests.Session()
+_SESSION.headers.update(HEADERS)
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=1.0, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+))
+
+class TokenBucket:
+    """Thread-safe token bucket: callers only block when the request budget is used up"""
+    
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.ts = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+            self.ts = now
+            if self.tokens < 1:
+                time.sleep((1 - self.tokens) / self.rate)
+                self.tokens = 0
+                self.ts = time.monotonic()
+            else:
+                self.tokens -= 1
+
+# SEC fair-access limit is 10 requests/second; stay under it across all threads
+_RATE = TokenBucket(8, 8)
+
 MAX_FILE_SIZE = 45 * 1024 * 1024  # 45MB
 
+TRUNCATION_NOTE = b"\n\n[Content truncated to fit 50MB limit]"
+
+# Large filings go up as concurrent 8MB parts instead of one single-shot PUT
+UPLOAD_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=4,
+    use_threads=True
+)
+
+# Exhibits after the first </DOCUMENT> are never used, so downloads stop there
+DOC_END = b'</DOCUMENT>'
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# S3 key builders per form type (main() only selects 10-K and 10-Q filings)
+_KEY_FMT = {
+    '10-K': lambda bank, date: f"{bank}/10-K/{date[:4]}.txt",
+    '10-Q': lambda bank, date: f"{bank}/10-Q/{date[:4]}-Q{(int(date[5:7]) - 1) // 3 + 1}.txt"
+}
+
+# Raw filings cached across runs (gzip SGML keyed by accession), so reruns skip SEC entirely
+SEC_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'bankiq', 'sec')
+
 def clean_text(text):
     """Clean and normalize text"""
-    text = re.sub(r'\n\s*\n\s*\n+', '\n\n', text)
-    text = '\n'.join(line for line in text.split('\n') if line.strip())
-    return text.strip()
+    return '\n'.join(filter(None, map(str.rstrip, text.split('\n')))).strip()
+
+# Regex fast path: filing HTML is machine-generated and well formed, so stripping tags and
+# trimming each line approximates get_text(separator='\n', strip=True) at a fraction of the cost
+_NON_CONTENT = re.compile(r'<!--.*?-->|<(script|style|noscript|iframe)\b[^>]*>.*?</\1\s*>', re.I | re.S)
+_TAG = re.compile(r'<[^>]+>')
+
+def strip_tags_fast(html_content):
+    """Strip markup with regexes; returns None when the output looks unreliable"""
+    text = _NON_CONTENT.sub('\n', html_content)
+    text = _TAG.sub('\n', text)
+    # A bare '<' must be escaped in valid HTML, so leftovers mean tags the regex missed
+    if text.count('<') > len(text) // 10000:
+        return None
+    # Trim both ends of every line, as strip=True does per text node (drops &nbsp; indentation too)
+    text = '\n'.join(filter(None, map(str.strip, html.unescape(text).split('\n'))))
+    return text if len(text) > 1000 else None
 
 def extract_clean_text_from_html(html_content):
     """Extract clean text from HTML filing"""
+    text = strip_tags_fast(html_content)
+    if text is not None:
+        return text
+    
     try:
-        soup = BeautifulSoup(html_content, 'lxml')
-        
-        for tag in soup(['script', 'style', 'meta', 'link', 'noscript']):
-            tag.decompose()
-        
-        text = soup.get_text(separator='\n', strip=True)
+        if LexborHTMLParser is not None:
+            tree = LexborHTMLParser(html_content)
+            
+            for node in tree.css('script, style, meta, link, noscript'):
+                node.decompose()
+            
+            root = tree.body or tree
+            text = root.text(separator='\n', strip=True)
+        else:
+            soup = BeautifulSoup(html_content, 'lxml')
+            
+            for tag in soup(['script', 'style', 'meta', 'link', 'noscript']):
+                tag.decompose()
+            
+            text = soup.get_text(separator='\n', strip=True)
         return clean_text(text)
     except Exception as e:
         print(f"      Error parsing HTML: {e}")
         return None
 
+def truncate_utf8(buf, limit):
+    """Cut encoded text to at most limit bytes without splitting a multi-byte character"""
+    if len(buf) <= limit:
+        return buf
+    cut = limit
+    # buf[cut] is the first dropped byte; if it continues a character, drop that character's lead bytes too
+    while cut > 0 and (buf[cut] & 0xC0) == 0x80:
+        cut -= 1
+    return buf[:cut]
+
+def read_first_document(response):
+    """Read a streamed submission only up to the end of its first document (the main filing)"""
+    buf = bytearray()
+    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+        # Rescan only the tail that could hold a marker split across chunks
+        scan_from = max(0, len(buf) - len(DOC_END) + 1)
+        buf += chunk
+        end = buf.find(DOC_END, scan_from)
+        if end != -1:
+            return bytes(buf[:end + len(DOC_END)])
+    return bytes(buf)
+
+def read_cached_filing(accession):
+    """Return cached raw filing bytes, or None on a miss or unreadable entry"""
+    try:
+        with open(os.path.join(SEC_CACHE_DIR, f"{accession}.txt.gz"), 'rb') as f:
+            return gzip.decompress(f.read())
+    except (OSError, EOFError):
+        return None
+
+def write_cached_filing(accession, raw):
+    """Best-effort cache write; temp file + rename so a crash never leaves a truncated entry"""
+    try:
+        os.makedirs(SEC_CACHE_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile('wb', dir=SEC_CACHE_DIR, delete=False) as tf:
+            tf.write(gzip.compress(raw, compresslevel=6))
+        os.replace(tf.name, os.path.join(SEC_CACHE_DIR, f"{accession}.txt.gz"))
+    except OSError as e:
+        print(f"      Warning: could not cache filing: {e}")
+
+@functools.lru_cache(maxsize=1)
+def _s3_client():
+    """S3 client built once per run instead of once per filing"""
+    return boto3.client('s3')
+
+def already_uploaded(s3, bucket, key, accession, size):
+    """True when the object at key already holds this accession's text (same accession metadata and size)"""
+    try:
+        head = s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] != '404':
+            raise
+        return False
+    return head['Metadata'].get('accession') == accession and head['ContentLength'] == size
+
 def download_filing(bank_name, cik, form_type, date, accession, s3_bucket):
     """Download a single filing"""
     try:
         cik_no_leading = cik.lstrip('0')
         accession_no_dash = accession.replace('-', '')
         
-        txt_url = f"https://www.sec.gov/Archives/edgar/data/{cik_no_leading}/{accession_no_dash}/{accession}.txt"
-        response = requests.get(txt_url, headers=HEADERS, timeout=30)
+        raw = read_cached_filing(accession)
+        if raw is None:
+            txt_url = f"https://www.sec.gov/Archives/edgar/data/{cik_no_leading}/{accession_no_dash}/{accession}.txt"
+            _RATE.acquire()
+            with _SESSION.get(txt_url, stream=True, timeout=30) as response:
+                if response.status_code != 200:
+                    print(f"      Failed: HTTP {response.status_code}")
+                    return False
+                raw = read_first_document(response)
+            write_cached_filing(accession, raw)
         
-        if response.status_code != 200:
-            print(f"      Failed: HTTP {response.status_code}")
-            return False
+        content = None
         
-        content = response.text
+        # Extract main document from SGML on the raw bytes, decoding only its <TEXT> body
+        start = raw.find(b'<DOCUMENT>')
+        # raw ends at the first </DOCUMENT> (see read_first_document), so search for the
+        # closing markers from the end; only the header and tail bytes get scanned
+        end = raw.rfind(DOC_END, start) if start != -1 else -1
         
-        # Extract main document from SGML
-        if '<DOCUMENT>' in content:
-            start = content.find('<DOCUMENT>')
-            end = content.find('</DOCUMENT>', start)
+        if start != -1 and end != -1:
+            text_start = raw.find(b'<TEXT>', start, end)
+            text_end = raw.rfind(b'</TEXT>', start, end)
             
-            if start != -1 and end != -1:
-                doc_section = content[start:end]
-                text_start = doc_section.find('<TEXT>')
-                text_end = doc_section.find('</TEXT>')
+            if text_start != -1 and text_end != -1:
+                doc_bytes = raw[text_start + 6:text_end]
+                doc_content = doc_bytes.decode('utf-8', errors='replace')
                 
-                if text_start != -1 and text_end != -1:
-                    doc_content = doc_section[text_start + 6:text_end]
-                    
-                    if '<html' in doc_content.lower():
-                        clean_content = extract_clean_text_from_html(doc_content)
-                        if clean_content and len(clean_content) > 1000:
-                            content = clean_content
-                        else:
-                            print(f"      Warning: Extracted text too short")
-                            return False
+                if b'<html' in doc_bytes[:2048].lower():
+                    clean_content = extract_clean_text_from_html(doc_content)
+                    if clean_content and len(clean_content) > 1000:
+                        content = clean_content
                     else:
-                        content = clean_text(doc_content)
+                        print(f"      Warning: Extracted text too short")
+                        return False
+                else:
+                    content = clean_text(doc_content)
+        
+        if content is None:
+            content = raw.decode('utf-8', errors='replace')
         
         # Add metadata header
         header = f"""SEC {form_type} Filing
@@ -87,27 +256,30 @@ Accession: {accession}
 {'='*80}
 
 """
-        final_content = header + content
+        body = (header + content).encode('utf-8')
         
-        # Check size
-        if len(final_content.encode('utf-8')) > MAX_FILE_SIZE:
+        # Check size (the limit is in bytes, so truncate the encoded text)
+        if len(body) > MAX_FILE_SIZE:
             print(f"      Warning: File too large, truncating...")
-            final_content = final_content[:MAX_FILE_SIZE]
+            body = truncate_utf8(body, MAX_FILE_SIZE - len(TRUNCATION_NOTE)) + TRUNCATION_NOTE
         
         # Upload to S3
-        year = date[:4]
-        quarter = f"-Q{(int(date[5:7]) - 1) // 3 + 1}" if form_type == '10-Q' else ''
-        s3_key = f"{bank_name}/{form_type}/{year}{quarter}.txt"
+        s3_key = _KEY_FMT[form_type](bank_name, date)
+        
+        s3 = _s3_client()
+        size_mb = len(body) / (1024 * 1024)
+        if already_uploaded(s3, s3_bucket, s3_key, accession, len(body)):
+            print(f"      ✓ Already in s3://{s3_bucket}/{s3_key} ({size_mb:.1f}MB)")
+            return True
         
-        s3 = boto3.client('s3')
-        s3.put_object(
-            Bucket=s3_bucket,
-            Key=s3_key,
-            Body=final_content.encode('utf-8'),
-            ContentType='text/plain; charset=utf-8'
+        s3.upload_fileobj(
+            io.BytesIO(body),
+            s3_bucket,
+            s3_key,
+            ExtraArgs={'ContentType': 'text/plain; charset=utf-8', 'Metadata': {'accession': accession}},
+            Config=UPLOAD_CONFIG
         )
         
-        size_mb = len(final_content.encode('utf-8')) / (1024 * 1024)
         print(f"      ✓ Uploaded {size_mb:.1f}MB to s3://{s3_bucket}/{s3_key}")
         return True
         
@@ -130,23 +302,24 @@ def main():
     
     # Get filings list
     submissions_url = f"https://data.sec.gov/submissions/CIK{cik}.json"
-    response = requests.get(submissions_url, headers=HEADERS, timeout=10)
+    _RATE.acquire()
+    response = _SESSION.get(submissions_url, timeout=10)
     
     if response.status_code != 200:
         print(f"Failed to fetch submissions: HTTP {response.status_code}")
         sys.exit(1)
     
-    data = response.json()
+    data = orjson.loads(response.content) if orjson else response.json()
     filings = data['filings']['recent']
     
     # Filter for 10-K and 10-Q from Oct 2024 - Oct 2025
+    # (EDGAR lists recent filings newest first, so stop once dates fall before the window)
     target_filings = []
-    for i in range(len(filings['form'])):
-        form = filings['form'][i]
-        date = filings['filingDate'][i]
-        accession = filings['accessionNumber'][i]
+    for form, date, accession in zip(filings['form'], filings['filingDate'], filings['accessionNumber']):
+        if date < '2024-10':
+            break
         
-        if (form in ['10-K', '10-Q']) and ('2024-10' <= date <= '2025-10-31'):
+        if (form in ('10-K', '10-Q')) and date <= '2025-10-31':
             target_filings.append({'form': form, 'date': date, 'accession': accession})
     
     print(f"Found {len(target_filings)} filings\n")
@@ -157,7 +330,6 @@ def main():
         print(f"[{i}/{len(target_filings)}] Downloading {filing['form']} {filing['date']}...")
         if download_filing(bank_folder, cik, filing['form'], filing['date'], filing['accession'], s3_bucket):
             success_count += 1
-        time.sleep(0.2)  # Rate limiting
     
     print(f"\n✓ Successfully uploaded {success_count}/{len(target_filings)} filings")
 